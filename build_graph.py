@@ -0,0 +1,127 @@
+"""
+Small dependency-graph scheduler for build steps.
+
+Each step declares the inputs it consumes and the outputs it produces. A step
+depends on every other step that produces one of its inputs, and independent
+steps run concurrently.
+"""
+import concurrent.futures
+import logging
+import time
+
+from telemetry import span
+
+
+class BuildStep:
+
+    def __init__(self, name, action, inputs=(), outputs=()):
+        """
+        :param action: callable that performs the step
+        :param inputs: source paths or artifact names the step consumes
+        :param outputs: artifact names the step produces
+        """
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+
+class BuildGraph:
+
+    def __init__(self, steps):
+        self._steps = {step.name: step for step in steps}
+        producers = {}
+        for step in steps:
+            for output in step.outputs:
+                producers[output] = step.name
+        self._dependencies = {
+            step.name: {
+                producers[item]
+                for item in step.inputs
+                if item in producers and producers[item] != step.name
+            } for step in steps
+        }
+        self._order = self._getTopologicalOrder()
+
+    def describe(self):
+        """
+        Return a printable description of the planned graph, one line per
+        step, grouped into stages of steps that can run at the same time.
+        """
+        stages = {}
+        for name in self._order:
+            stages[name] = 1 + max(
+                (stages[dep] for dep in self._dependencies[name]), default=0)
+        lines = []
+        for name in self._order:
+            step = self._steps[name]
+            deps = ", ".join(sorted(self._dependencies[name])) or "-"
+            lines.append(f"stage {stages[name]}: {name} (after: {deps}; "
+                         f"inputs: {', '.join(step.inputs) or '-'}; "
+                         f"outputs: {', '.join(step.outputs) or '-'})")
+        return "\n".join(lines)
+
+    def run(self, jobs=None):
+        """
+        Run every step as soon as the steps it depends on have finished.
+
+        When a step fails, no further steps are started; the steps already
+        running are allowed to finish and the first error is re-raised.
+        """
+        pending = {
+            name: set(deps) for name, deps in self._dependencies.items()
+        }
+        error = None
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=jobs or len(self._steps) or 1) as pool:
+            running = {}
+            while True:
+                if error is None:
+                    for name in self._order:
+                        if name in pending and not pending[name]:
+                            del pending[name]
+                            logging.info(f"Starting build step {name}")
+                            running[pool.submit(self._runStep,
+                                                name)] = name
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        logging.error(f"Build step {name} failed")
+                        error = error or future.exception()
+                        continue
+                    for deps in pending.values():
+                        deps.discard(name)
+        if error is not None:
+            raise error
+        if pending:
+            raise RuntimeError(f"Build steps not run: {sorted(pending)}")
+
+    def _runStep(self, name):
+        start = time.monotonic()
+        with span(f"build step {name}"):
+            self._steps[name].action()
+        logging.info(f"Build step {name} finished in "
+                     f"{time.monotonic() - start:.1f}s")
+
+    def _getTopologicalOrder(self):
+        order = []
+        visiting = set()
+
+        def _visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Build step {name} depends on itself")
+            visiting.add(name)
+            for dep in sorted(self._dependencies[name]):
+                _visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self._steps:
+            _visit(name)
+        return order
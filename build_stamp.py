@@ -0,0 +1,113 @@
+"""
+Build stamps recording what a build step was last run against, so that
+no-op rebuilds can be skipped.
+
+A stamp holds two fingerprints of the step's source tree:
+
+* configure: the build config plus every wscript in the tree
+* build: the configure fingerprint plus the git tree of the sources, the
+  contents of every dirty (modified or untracked) file and the recorded
+  build fingerprints of the upstream steps
+"""
+import hashlib
+import json
+import logging
+import os
+import subprocess
+
+from format_cache import hash_file
+from git_utils import get_git_status_files, run_git
+from json_cache import load_json, write_json_atomic
+from telemetry import span
+
+STAMP_DIR_NAME = ".build_hack_stamps"
+
+
+class BuildStamp:
+
+    def __init__(self, name, src_path, build_config, stamp_dir, upstream=()):
+        """
+        :param name: name of the build step, one stamp is kept per step
+        :param src_path: source tree the step builds from
+        :param build_config: dict of settings (build type, command, ...) that
+            require a rebuild when they change
+        :param stamp_dir: directory holding the stamps
+        :param upstream: names of the steps whose outputs this step builds
+            on, so that rebuilding any of them rebuilds this step too
+        """
+        self._name = name
+        self._src_path = src_path
+        self._build_config = build_config
+        self._stamp_dir = stamp_dir
+        self._stamp_file = os.path.join(stamp_dir, f"{name}.json")
+        self._upstream = list(upstream)
+        self._fingerprint = None
+        self._fingerprinted = False
+
+    def isBuildUpToDate(self):
+        fingerprint = self._getFingerprint()
+        return fingerprint is not None and self._load(
+            self._stamp_file) == fingerprint
+
+    def isConfigureUpToDate(self):
+        fingerprint = self._getFingerprint()
+        return (fingerprint is not None and self._load(
+            self._stamp_file).get("configure") == fingerprint["configure"])
+
+    def record(self):
+        """
+        Record the fingerprint taken before the build, so that sources
+        edited while the build was running still trigger the next rebuild.
+        """
+        fingerprint = self._getFingerprint()
+        if fingerprint is None:
+            return
+        write_json_atomic(self._stamp_file, fingerprint)
+
+    def _load(self, stamp_file):
+        return load_json(stamp_file, {})
+
+    def _getFingerprint(self):
+        if not self._fingerprinted:
+            self._fingerprinted = True
+            try:
+                with span("fingerprint", step=self._name):
+                    self._fingerprint = self._computeFingerprint()
+            except (OSError, subprocess.CalledProcessError) as e:
+                logging.warning(
+                    f"Could not fingerprint {self._src_path} for build step "
+                    f"{self._name}, it will always be rebuilt: {e}")
+        return self._fingerprint
+
+    def _computeFingerprint(self):
+        # HEAD:./ is the tree object of the current directory, so this also
+        # works for steps building a subdirectory of a checkout.
+        tree_hash = run_git(["rev-parse", "HEAD:./"],
+                            cwd=self._src_path).strip()
+        dirty_files = {}
+        for file in get_git_status_files(self._src_path):
+            if os.path.isfile(file):
+                dirty_files[file] = hash_file(file)
+            else:
+                dirty_files[file] = "deleted"
+        wscripts = run_git(["ls-files", "-s", "--", ":(glob)**/wscript"],
+                           cwd=self._src_path)
+
+        configure = hashlib.sha1()
+        configure.update(json.dumps(self._build_config, sort_keys=True).encode())
+        configure.update(wscripts.encode())
+        for file, file_hash in sorted(dirty_files.items()):
+            if os.path.basename(file) == "wscript":
+                configure.update(f"{file}:{file_hash}".encode())
+
+        build = hashlib.sha1()
+        build.update(configure.hexdigest().encode())
+        build.update(tree_hash.encode())
+        build.update(json.dumps(dirty_files, sort_keys=True).encode())
+        # Upstream steps run before this one, so their stamps are already
+        # up to date here.
+        for name in self._upstream:
+            upstream_stamp = self._load(
+                os.path.join(self._stamp_dir, f"{name}.json"))
+            build.update(f"{name}:{upstream_stamp.get('build')}".encode())
+        return {"configure": configure.hexdigest(), "build": build.hexdigest()}
@@ -0,0 +1,118 @@
+import logging
+import os
+
+from build_graph import BuildStep
+from build_stamp import STAMP_DIR_NAME, BuildStamp
+from cmd_runner import run_cmd
+from environment import get_environment
+
+WAF_CMD = "waf configure build install"
+WAF_BUILD_CMD = "waf build install"
+
+
+class Builder:
+
+    def __init__(self, timeout=None, force=False):
+        self._timeout = timeout
+        self._force = force
+
+    def buildMaestroWithoutTests(self):
+        env = get_environment()
+        self._runWaf("maestro",
+                     env.maestro_src_path,
+                     "--target=maestro",
+                     upstream=["mmshare"])
+
+    def buildMMSharePython(self):
+        env = get_environment()
+        make_py = ["make", "python"]
+        stamp = self._getStamp("mmshare-python", env.mmshare_src_path,
+                               make_py)
+        if stamp.isBuildUpToDate():
+            logging.info("mmshare python modules are up to date, skipping")
+            return
+        run_cmd(make_py, cwd=env.mmshare_build_dir, timeout=self._timeout)
+        stamp.record()
+        logging.info("Done!")
+
+    def buildMMShareWithoutMakeSteps(self):
+        env = get_environment()
+        self._runWaf("mmshare", env.mmshare_src_path, "--skipmakesteps")
+
+    def _runWaf(self, name, src_path, waf_args, upstream=()):
+        """
+        Run waf for `name` unless its sources, build config and `upstream`
+        steps are unchanged since its last successful build. The configure
+        phase is skipped when only the sources changed.
+        """
+        stamp = self._getStamp(name, src_path, waf_args, upstream)
+        if stamp.isBuildUpToDate():
+            logging.info(f"{name} is up to date, skipping build")
+            return
+        if stamp.isConfigureUpToDate():
+            logging.info(f"{name} build config unchanged, skipping configure")
+            cmd = f"{WAF_BUILD_CMD} {waf_args}"
+        else:
+            cmd = f"{WAF_CMD} {waf_args}"
+        cmd += f" --build={get_environment().build_type}"
+        run_cmd(cmd, cwd=src_path, timeout=self._timeout)
+        stamp.record()
+
+    def _getStamp(self, name, src_path, cmd, upstream=()):
+        env = get_environment()
+        stamp = BuildStamp(name,
+                           src_path,
+                           build_config={
+                               "BUILD_TYPE": env.build_type,
+                               "SCHRODINGER": env.schrodinger,
+                               "cmd": cmd
+                           },
+                           stamp_dir=os.path.join(env.schrodinger,
+                                                  STAMP_DIR_NAME),
+                           upstream=upstream)
+        if self._force:
+            return _ForcedBuildStamp(stamp)
+        return stamp
+
+    def getSteps(self):
+        """
+        Return the build steps keyed by the command line option selecting
+        them. Maestro links against the mmshare libraries, so it has to wait
+        for the mmshare build; the python modules are built independently.
+        """
+        env = get_environment()
+        return {
+            "build_mmshare_without_make":
+                BuildStep("mmshare",
+                          self.buildMMShareWithoutMakeSteps,
+                          inputs=[env.mmshare_src_path],
+                          outputs=["mmshare-libs"]),
+            "build_mmshare_python":
+                BuildStep("mmshare-python",
+                          self.buildMMSharePython,
+                          inputs=[env.mmshare_src_path],
+                          outputs=["mmshare-python-modules"]),
+            "build_maestro_only":
+                BuildStep("maestro",
+                          self.buildMaestroWithoutTests,
+                          inputs=[env.maestro_src_path, "mmshare-libs"],
+                          outputs=["maestro"]),
+        }
+
+
+class _ForcedBuildStamp:
+    """
+    Build stamp wrapper that never reports anything as up to date.
+    """
+
+    def __init__(self, stamp):
+        self._stamp = stamp
+
+    def isBuildUpToDate(self):
+        return False
+
+    def isConfigureUpToDate(self):
+        return False
+
+    def record(self):
+        self._stamp.record()
@@ -0,0 +1,428 @@
+"""
+Benchmark the CLI's own code paths at growing scale and fail on regressions.
+
+Every case runs against generated fixtures instead of a Schrodinger
+installation: synthetic git repos, timing and graphics logs, and a fake
+$SCHRODINGER holding stub `waf`, `run` and `maestro` executables. Each run of
+a case happens in a fresh interpreter, which reports the wall time and peak
+RSS of the benchmarked call alone, so cases share neither caches nor memory
+high-water marks.
+
+    python cli_benchmark.py --scales 10 100 1000 --save baseline.json
+    python cli_benchmark.py --baseline baseline.json --threshold 0.25
+
+A stub can be replaced with any executable script through `--stub`, e.g.
+`--stub waf=slow_waf.py`.
+"""
+import collections
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS, ArgumentParser
+
+from git_utils import run_git
+
+SCRIPT = os.path.abspath(__file__)
+DEFAULT_SCALES = (10, 100, 1000)
+DEFAULT_THRESHOLD = 0.25
+# Slowdowns smaller than this are noise at the smallest scales.
+MIN_DELTA_SECONDS = 0.02
+COMMAND_LOG_ENTRIES = 50
+GRAPHICS_ACTIVITIES = ("Main Drawing", "Command Handling", "Structure Drawing",
+                       "Surface Drawing", "Picking")
+
+DEFAULT_STUBS = {
+    "waf":
+    """#!{python}
+import os
+import sys
+
+lines = int(os.getenv("FAKE_WAF_LINES", "100"))
+for i in range(lines):
+    sys.stdout.write(f"[{i + 1}/{lines}] Compiling src/file_{i}.cpp\\n")
+""",
+    "run":
+    """#!/bin/sh
+exit 0
+""",
+    "maestro":
+    """#!{python}
+import os
+import re
+import sys
+
+if "-c" not in sys.argv:
+    sys.exit("maestro stub: no command file given with -c")
+cmd_file = sys.argv[sys.argv.index("-c") + 1]
+output_dir = os.environ["SCHRODINGER_PERFORMANCE_TEST_OUTPUT"]
+log_dir = os.path.join(output_dir, "performance_logs")
+os.makedirs(log_dir, exist_ok=True)
+input_file = None
+with open(cmd_file) as f:
+    for line in f:
+        if match := re.match(r"(?:entryimport|projectopen) (\\S+)", line):
+            input_file = os.path.basename(match.group(1))
+        elif match := re.match(r"timingsetup file=(\\S+)", line):
+            log_file = match.group(1)
+            with open(log_file, "w") as log:
+                log.write('"Timing"\\n"Period\\t1"\\n"Main Drawing\\t0.010"\\n')
+            with open(os.path.join(log_dir, os.path.basename(log_file)),
+                      "w") as log:
+                log.write(f'"{input_file}"\\nimport = 10 ms\\n')
+""",
+}
+
+Case = collections.namedtuple("Case", ["unit", "per_scale", "setup", "run"])
+CaseResult = collections.namedtuple(
+    "CaseResult", ["units", "seconds", "units_per_second", "max_rss_mb"])
+
+
+class FakeToolchain:
+    """
+    Fake $SCHRODINGER and $SCHRODINGER_SRC under `root`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.schrodinger = os.path.join(root, "schrodinger")
+        self.schrodinger_src = os.path.join(root, "src")
+        self.input_dir = os.path.join(root, "input")
+        self.output_dir = os.path.join(root, "output")
+
+    def install(self, stubs=None):
+        """
+        Create the directories and write the stub executables.
+
+        :param stubs: scripts replacing the default stubs, keyed by name; a
+            "#!{python}" shebang stands for the running interpreter
+        """
+        for path in (os.path.join(self.schrodinger, "mmshare-v1.0"),
+                     self.schrodinger_src, self.input_dir, self.output_dir):
+            os.makedirs(path, exist_ok=True)
+        for name, source in {**DEFAULT_STUBS, **(stubs or {})}.items():
+            path = os.path.join(self.schrodinger, name)
+            with open(path, "w") as f:
+                f.write(source.replace("#!{python}", f"#!{sys.executable}", 1))
+            os.chmod(path, 0o755)
+
+    def getEnviron(self):
+        return dict(os.environ,
+                    SCHRODINGER=self.schrodinger,
+                    SCHRODINGER_SRC=self.schrodinger_src,
+                    SCHRODINGER_LIB=os.path.join(self.root, "lib"),
+                    BUILD_TYPE="OPT",
+                    BUILD_HACK_LOG_DIR=os.path.join(self.root, "logs"),
+                    BUILD_HACK_EXTRA_REPOS="",
+                    SCHRODINGER_PERFORMANCE_TEST_INPUT=self.input_dir,
+                    SCHRODINGER_PERFORMANCE_TEST_OUTPUT=self.output_dir,
+                    SCHRODINGER_PERFORMANCE_TEST_MAESTRO="",
+                    PATH=self.schrodinger + os.pathsep +
+                    os.environ.get("PATH", ""))
+
+
+def _write_files(directory, names, contents):
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(contents(name))
+
+
+def _setup_modified_files(toolchain, count):
+    """
+    An mmshare checkout with maestro inside, holding `count` committed files
+    of which every other one is modified, plus `count // 10` untracked ones.
+    """
+    repo = os.path.join(toolchain.schrodinger_src, "mmshare")
+    half = count // 2
+    _write_files(repo, (f"module_{i}.py" for i in range(half)),
+                 lambda name: f"# {name}\n")
+    _write_files(os.path.join(repo, "maestro"),
+                 (f"source_{i}.cpp" for i in range(count - half)),
+                 lambda name: f"// {name}\n")
+    run_git(["init", "-q"], cwd=repo)
+    run_git(["add", "-A"], cwd=repo)
+    run_git([
+        "-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost",
+        "commit", "-q", "-m", "Synthetic checkout"
+    ],
+            cwd=repo)
+    _write_files(repo, (f"module_{i}.py" for i in range(0, half, 2)),
+                 lambda name: f"# {name} modified\n")
+    _write_files(repo, (f"untracked_{i}.py" for i in range(count // 10)),
+                 lambda name: f"# {name}\n")
+
+
+def _run_modified_files(toolchain, count):
+    from formatter import get_modified_files
+    get_modified_files(["mmshare", "mmshare/maestro"], "HEAD")
+
+
+def _setup_run_cmd(toolchain, count):
+    pass
+
+
+def _run_run_cmd(toolchain, count):
+    from cmd_runner import run_cmd
+    os.environ["FAKE_WAF_LINES"] = str(count)
+    run_cmd(["waf", "build", "install"], cwd=toolchain.root)
+
+
+def _setup_run_tests(toolchain, count):
+    _write_files(toolchain.root, ["test_synthetic.py"],
+                 lambda name: "def test_pass():\n    pass\n")
+
+
+def _run_run_tests(toolchain, count):
+    from tester import Tester
+    Tester().run_tests(os.path.join(toolchain.root, "test_synthetic.py"),
+                       count)
+
+
+def _setup_command_logs(toolchain, count):
+    _write_files(
+        os.path.join(toolchain.output_dir, "performance_logs"),
+        (f"input_{i}.mae.log" for i in range(count)),
+        lambda name: f'"{name[:-len(".log")]}"\n' + "".join(
+            f"function_{j} = {j * 7 % 100} ms\n"
+            for j in range(COMMAND_LOG_ENTRIES)))
+
+
+def _run_command_logs(toolchain, count):
+    from performance_tests import process_files_in_directory
+    process_files_in_directory(os.path.join(toolchain.output_dir,
+                                            "performance_logs"),
+                               os.path.join(toolchain.root, "command.csv"),
+                               incremental=False)
+
+
+def _setup_graphics_logs(toolchain, count):
+    _write_files(
+        toolchain.output_dir, (f"input_{i}.mae.log" for i in range(count)),
+        lambda name: '"Timing"\n"Period\t1"\n' + "".join(
+            f'"{activity}\t{j * 0.013:.3f}"\n'
+            for j, activity in enumerate(GRAPHICS_ACTIVITIES)))
+
+
+def _run_graphics_logs(toolchain, count):
+    from performance_tests import write_graphics_output_to_csv
+    write_graphics_output_to_csv(
+        sorted(
+            os.path.join(toolchain.output_dir, name)
+            for name in os.listdir(toolchain.output_dir)
+            if name.endswith(".log")),
+        os.path.join(toolchain.root, "graphics.csv"))
+
+
+def _setup_maestro_run(toolchain, count):
+    _write_files(toolchain.input_dir, (f"input_{i}.mae" for i in range(count)),
+                 lambda name: "f_m_ct {\n}\n")
+
+
+def _run_maestro_run(toolchain, count):
+    from performance_tests import (get_input_files, prepare_cmd_string,
+                                   run_maestro)
+    returncode = run_maestro(prepare_cmd_string(get_input_files()))
+    if returncode:
+        sys.exit(f"Maestro exited with {returncode}")
+
+
+CASES = {
+    "modified_files": Case("files", 10, _setup_modified_files,
+                           _run_modified_files),
+    "run_cmd": Case("lines", 100, _setup_run_cmd, _run_run_cmd),
+    "run_tests": Case("runs", 1, _setup_run_tests, _run_run_tests),
+    "command_logs": Case("logs", 10, _setup_command_logs, _run_command_logs),
+    "graphics_logs": Case("logs", 10, _setup_graphics_logs,
+                          _run_graphics_logs),
+    "maestro_run": Case("inputs", 1, _setup_maestro_run, _run_maestro_run),
+}
+
+
+def run_case_in_process(name, root, count, result_file):
+    """
+    Run a case in this process and write its wall time and peak RSS as JSON
+    to `result_file`.
+    """
+    toolchain = FakeToolchain(root)
+    start = time.perf_counter()
+    CASES[name].run(toolchain, count)
+    seconds = time.perf_counter() - start
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss_kb //= 1024
+    with open(result_file, "w") as f:
+        json.dump({"seconds": seconds, "max_rss_kb": max_rss_kb}, f)
+
+
+def run_case(name, scale, work_dir, repeat=3, stubs=None):
+    """
+    Run a case `repeat` times at `scale` on fresh fixtures, each run in its
+    own interpreter.
+
+    :return: CaseResult with the median wall time and peak RSS of the runs
+    """
+    case = CASES[name]
+    count = scale * case.per_scale
+    root = os.path.join(work_dir, f"{name}-{scale}")
+    toolchain = FakeToolchain(root)
+    toolchain.install(stubs)
+    case.setup(toolchain, count)
+
+    result_file = os.path.join(work_dir, "result.json")
+    seconds = []
+    max_rss_kb = []
+    try:
+        for _ in range(repeat):
+            subprocess.run([
+                sys.executable, SCRIPT, "--run-case", name, "--root", root,
+                "--count",
+                str(count), "--result", result_file
+            ],
+                           env=toolchain.getEnviron(),
+                           stdout=subprocess.DEVNULL,
+                           check=True)
+            with open(result_file) as f:
+                result = json.load(f)
+            seconds.append(result["seconds"])
+            max_rss_kb.append(result["max_rss_kb"])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    median = statistics.median(seconds)
+    return CaseResult(count, round(median, 4),
+                      round(count / median, 1) if median else 0.0,
+                      round(statistics.median(max_rss_kb) / 1024, 1))
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    :param results: CaseResult keyed by case name and scale
+    :param baseline: results of a previous run, as saved by `save_results`
+    :return: list of (case name, scale, metric, baseline value, value) of
+        the wall times and peak RSS more than `threshold` above the baseline
+    """
+    regressions = []
+    for name, by_scale in results.items():
+        for scale, result in by_scale.items():
+            previous = baseline.get(name, {}).get(str(scale))
+            if previous is None:
+                continue
+            if (result.seconds > previous["seconds"] * (1 + threshold) and
+                    result.seconds - previous["seconds"] > MIN_DELTA_SECONDS):
+                regressions.append((name, scale, "seconds",
+                                    previous["seconds"], result.seconds))
+            if result.max_rss_mb > previous["max_rss_mb"] * (1 + threshold):
+                regressions.append((name, scale, "max_rss_mb",
+                                    previous["max_rss_mb"], result.max_rss_mb))
+    return regressions
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(
+            {
+                name: {
+                    str(scale): result._asdict()
+                    for scale, result in by_scale.items()
+                }
+                for name, by_scale in results.items()
+            },
+            f,
+            indent=2)
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--cases",
+                        nargs="+",
+                        choices=list(CASES),
+                        default=list(CASES))
+    parser.add_argument("--scales",
+                        type=int,
+                        nargs="+",
+                        default=DEFAULT_SCALES,
+                        help="Scale factors of the fixtures (default: "
+                        f"{' '.join(map(str, DEFAULT_SCALES))})")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=3,
+                        help="Runs per case and scale, the median is "
+                        "reported (default: 3)")
+    parser.add_argument("--stub",
+                        action="append",
+                        default=[],
+                        metavar="NAME=FILE",
+                        help="Replace the stub executable NAME (waf, run, "
+                        "maestro) with the script FILE")
+    parser.add_argument("--save",
+                        metavar="FILE",
+                        help="Save the results as a JSON baseline")
+    parser.add_argument("--baseline",
+                        metavar="FILE",
+                        help="Fail if a case got slower or bigger than in "
+                        "this JSON baseline")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=DEFAULT_THRESHOLD,
+                        help="Relative increase over the baseline that "
+                        f"counts as a regression (default: "
+                        f"{DEFAULT_THRESHOLD})")
+    # Used by run_case to run a single case in a child interpreter
+    parser.add_argument("--run-case", help=SUPPRESS)
+    parser.add_argument("--root", help=SUPPRESS)
+    parser.add_argument("--count", type=int, help=SUPPRESS)
+    parser.add_argument("--result", help=SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.run_case:
+        run_case_in_process(args.run_case, args.root, args.count, args.result)
+        return
+
+    stubs = {}
+    for stub in args.stub:
+        name, _, path = stub.partition("=")
+        with open(path) as f:
+            stubs[name] = f.read()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'Case':<15} {'Scale':>6} {'Units':>8} {'Seconds':>9} "
+          f"{'Units/s':>10} {'RSS MB':>7} {'Baseline s':>10}")
+    results = collections.defaultdict(dict)
+    with tempfile.TemporaryDirectory(prefix="cli_benchmark") as work_dir:
+        for name in args.cases:
+            for scale in args.scales:
+                result = run_case(name, scale, work_dir, args.repeat, stubs)
+                results[name][scale] = result
+                previous = baseline.get(name, {}).get(str(scale))
+                previous_seconds = (f"{previous['seconds']:>10.3f}"
+                                    if previous else f"{'-':>10}")
+                print(
+                    f"{name:<15} {scale:>6} {result.units:>8} "
+                    f"{result.seconds:>9.3f} "
+                    f"{result.units_per_second:>10.0f} "
+                    f"{result.max_rss_mb:>7.1f} {previous_seconds}",
+                    flush=True)
+
+    if args.save:
+        save_results(results, args.save)
+    regressions = find_regressions(results, baseline, args.threshold)
+    for name, scale, metric, previous, value in regressions:
+        print(f"Regression in {name} at scale {scale}: {metric} "
+              f"{previous} -> {value}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Streaming subprocess layer used to run the build and formatter commands.
+
+Output is tee'd line by line to the terminal and to a rotating log file
+while the command runs, and only the last few lines are kept in memory for
+error reporting. Every command records its wall time, CPU time and peak RSS.
+"""
+import collections
+import logging
+import logging.handlers
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from telemetry import span
+
+LOG_DIR = os.getenv("BUILD_HACK_LOG_DIR",
+                    os.path.join(os.path.expanduser("~"), ".build_hack"))
+LOG_FILE_NAME = "cmd_output.log"
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+TAIL_LINES = 50
+MAX_LINE_BYTES = 64 * 1024
+
+CommandResult = collections.namedtuple(
+    "CommandResult",
+    ["returncode", "wall_time", "cpu_time", "max_rss_kb", "tail"])
+
+_output_logger = None
+_output_logger_lock = threading.Lock()
+
+
+def _get_output_logger():
+    global _output_logger
+    with _output_logger_lock:
+        if _output_logger is None:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(LOG_DIR, LOG_FILE_NAME),
+                maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            _output_logger = logging.getLogger("build_hack.cmd_output")
+            _output_logger.setLevel(logging.INFO)
+            _output_logger.propagate = False
+            _output_logger.addHandler(handler)
+        return _output_logger
+
+
+def kill_process_group(pid, sig=signal.SIGKILL):
+    """
+    Send `sig` to the process `pid` and every process it started, e.g. the
+    Maestro binary behind its launcher script. The process must have been
+    started in its own session.
+    """
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def run_cmd(cmd, cwd=None, timeout=None, check=True):
+    """
+    Run `cmd`, streaming its combined stdout/stderr to the terminal and to the
+    rotating command log.
+
+    :param cmd: list of arguments, or a string that is split shell-style
+    :param timeout: seconds after which the command is killed
+    :param check: whether to raise if the command exits with non-zero status
+    :raise RuntimeError: if the command times out, or fails and `check` is set
+    :rtype: CommandResult
+    """
+    cwd = cwd or os.getcwd()
+    if isinstance(cmd, str):
+        cmd = shlex.split(cmd)
+    logging.info(f"Command: {cmd} , inside directory: {cwd}")
+    output_logger = _get_output_logger()
+    output_logger.info(f"Command: {cmd} , inside directory: {cwd}")
+
+    with span(f"run {os.path.basename(cmd[0])}", cwd=cwd):
+        start = time.monotonic()
+        proc = subprocess.Popen(cmd,
+                                cwd=cwd,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                start_new_session=True)
+        timed_out = threading.Event()
+
+        def _kill():
+            # Kill the whole process group so that grandchildren holding on to
+            # the output pipe cannot keep us waiting.
+            timed_out.set()
+            kill_process_group(proc.pid)
+
+        timer = threading.Timer(timeout, _kill) if timeout else None
+        if timer:
+            timer.start()
+
+        tail = collections.deque(maxlen=TAIL_LINES)
+        try:
+            for raw_line in iter(lambda: proc.stdout.readline(MAX_LINE_BYTES),
+                                 b""):
+                line = raw_line.decode("utf-8", errors="replace")
+                sys.stdout.write(line)
+                sys.stdout.flush()
+                line = line.rstrip("\n")
+                output_logger.info(line)
+                tail.append(line)
+            proc.stdout.close()
+            # wait4 reaps the child and reports the resource usage of that
+            # child alone, which stays correct when several commands run
+            # concurrently.
+            _, status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        finally:
+            if timer:
+                timer.cancel()
+            if proc.returncode is None:
+                kill_process_group(proc.pid)
+                proc.wait()
+
+    max_rss_kb = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        max_rss_kb //= 1024
+    result = CommandResult(returncode=proc.returncode,
+                           wall_time=time.monotonic() - start,
+                           cpu_time=rusage.ru_utime + rusage.ru_stime,
+                           max_rss_kb=max_rss_kb,
+                           tail=list(tail))
+    summary = (f"Command {cmd[0]} exited with {result.returncode} after "
+               f"{result.wall_time:.1f}s wall, {result.cpu_time:.1f}s CPU, "
+               f"max RSS {result.max_rss_kb / 1024:.0f} MB")
+    logging.info(summary)
+    output_logger.info(summary)
+
+    if timed_out.is_set():
+        raise RuntimeError(f"Command {cmd} timed out after {timeout}s")
+    if check and result.returncode != 0:
+        raise RuntimeError(f"Command {cmd} failed with exit code "
+                           f"{result.returncode}:\n" + "\n".join(result.tail))
+    return result
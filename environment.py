@@ -0,0 +1,94 @@
+"""
+Build environment resolved from the environment variables on first use.
+
+Nothing here touches the environment at import time, so commands that do not
+need a given variable neither pay for nor fail on resolving it.
+"""
+import functools
+import glob
+import os
+
+MAESTRO_SRC = "mmshare/maestro"
+MMSHARE = "mmshare"
+REPOS = [MMSHARE, MAESTRO_SRC]
+MANDATORY_ENV_VARS = ("SCHRODINGER", "SCHRODINGER_SRC", "BUILD_TYPE",
+                      "SCHRODINGER_LIB")
+
+
+class Environment:
+
+    def __init__(self, environ=None):
+        self._environ = os.environ if environ is None else environ
+
+    def get(self, name):
+        value = self._environ.get(name)
+        if not value:
+            raise ValueError(f"Environment variable {name} is not set")
+        return value
+
+    @functools.cached_property
+    def schrodinger(self):
+        return self.get("SCHRODINGER")
+
+    @functools.cached_property
+    def schrodinger_src(self):
+        return self.get("SCHRODINGER_SRC")
+
+    @functools.cached_property
+    def build_type(self):
+        return self.get("BUILD_TYPE")
+
+    @functools.cached_property
+    def mmshare_src_path(self):
+        return os.path.join(self.schrodinger_src, MMSHARE)
+
+    @functools.cached_property
+    def maestro_src_path(self):
+        return os.path.join(self.schrodinger_src, MAESTRO_SRC)
+
+    @functools.cached_property
+    def mmshare_build_dir(self):
+        return glob.glob(os.path.join(self.schrodinger, "mmshare-v*"))[0]
+
+    @functools.cached_property
+    def schrodinger_run_cmd(self):
+        return os.path.join(self.schrodinger, "run")
+
+    @functools.cached_property
+    def pytest_cmd(self):
+        return os.path.join(self.schrodinger, "utilities", "py.test")
+
+    @functools.cached_property
+    def repos(self):
+        """
+        REPOS plus the extra repos listed (relative to $SCHRODINGER_SRC or
+        absolute, separated by os.pathsep) in $BUILD_HACK_EXTRA_REPOS.
+        """
+        extra_repos = self._environ.get("BUILD_HACK_EXTRA_REPOS", "")
+        return REPOS + [repo for repo in extra_repos.split(os.pathsep) if repo]
+
+    def getRepoPath(self, repo):
+        return os.path.join(self.schrodinger_src, repo)
+
+
+@functools.lru_cache(maxsize=None)
+def get_environment():
+    return Environment()
+
+
+class EnvironmentVerifier:
+
+    def __init__(self, env_vars=MANDATORY_ENV_VARS):
+        self._mandatory_env_vars = list(env_vars)
+
+    def verify(self, print_values=False):
+        missing_mandatory_env_vars = [
+            env for env in self._mandatory_env_vars if env not in os.environ
+        ]
+        for env in self._mandatory_env_vars:
+            if env in os.environ and print_values:
+                print(f"{env} = {os.environ[env]}")
+        if len(missing_mandatory_env_vars):
+            raise ValueError(
+                f"Environment variables {missing_mandatory_env_vars} is not set"
+            )
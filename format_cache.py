@@ -0,0 +1,121 @@
+"""
+On-disk cache of formatter/linter results, used by `--format` to skip files
+that have not changed since they were last formatted.
+
+Entries are keyed on the tool, its version, the file path and the file's
+content hash. The whole cache is dropped whenever one of the style config
+files of the repo changes, and the least recently used entries are evicted
+once the cache grows past `max_entries`.
+"""
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from json_cache import load_json, write_json_atomic
+
+CACHE_DIR_NAME = ".build_hack_cache"
+CACHE_FILE_NAME = "format_cache.json"
+CONFIG_FILES = (".style.yapf", ".clang-format", "setup.cfg")
+MAX_ENTRIES = 10000
+
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FormatCache:
+
+    def __init__(self, repo_path, max_entries=MAX_ENTRIES):
+        self._repo_path = repo_path
+        self._max_entries = max_entries
+        self._cache_dir = os.path.join(repo_path, CACHE_DIR_NAME)
+        self._cache_file = os.path.join(self._cache_dir, CACHE_FILE_NAME)
+        self._tool_versions = {}
+        self._config_hash = self._hashConfigFiles()
+        self._entries = self._load()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def get(self, tool, file):
+        """
+        Return the cached result of running `tool` on the current contents of
+        `file`, or None if the file has to be processed again.
+        """
+        key = self._getKey(tool, file)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry["used"] = time.time()
+            self._dirty = True
+            return entry["result"]
+
+    def put(self, tool, file, result=""):
+        key = self._getKey(tool, file)
+        with self._lock:
+            self._entries[key] = {"result": result, "used": time.time()}
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        if len(self._entries) > self._max_entries:
+            by_last_use = sorted(self._entries.items(),
+                                 key=lambda item: item[1]["used"])
+            self._entries = dict(by_last_use[-self._max_entries:])
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        gitignore = os.path.join(self._cache_dir, ".gitignore")
+        if not os.path.exists(gitignore):
+            with open(gitignore, "w") as f:
+                f.write("*\n")
+
+        write_json_atomic(self._cache_file, {
+            "config_hash": self._config_hash,
+            "entries": self._entries
+        })
+        self._dirty = False
+
+    def _load(self):
+        data = load_json(self._cache_file)
+        if data is None:
+            return {}
+        if data.get("config_hash") != self._config_hash:
+            logging.info("Style config changed, invalidating format cache")
+            return {}
+        return data.get("entries", {})
+
+    def _getKey(self, tool, file):
+        rel_path = os.path.relpath(os.path.abspath(file), self._repo_path)
+        return ":".join(
+            (tool, self._getToolVersion(tool), rel_path, hash_file(file)))
+
+    def _getToolVersion(self, tool):
+        # Racing workers may both ask for the version; that only costs an
+        # extra `--version` call.
+        if tool not in self._tool_versions:
+            try:
+                output = subprocess.run([tool, "--version"],
+                                        capture_output=True,
+                                        text=True)
+                version = (output.stdout or output.stderr).strip()
+            except OSError:
+                version = ""
+            self._tool_versions[tool] = version.split("\n")[0] or "unknown"
+        return self._tool_versions[tool]
+
+    def _hashConfigFiles(self):
+        digest = hashlib.sha1()
+        for name in CONFIG_FILES:
+            path = os.path.join(self._repo_path, name)
+            if os.path.isfile(path):
+                digest.update(name.encode())
+                digest.update(hash_file(path).encode())
+        return digest.hexdigest()
@@ -0,0 +1,172 @@
+import concurrent.futures
+import logging
+import os
+import subprocess
+
+from cmd_runner import run_cmd
+from environment import get_environment
+from format_cache import FormatCache
+from git_utils import get_git_modified_files, get_git_root
+from telemetry import span, traced
+
+CLANG_CMD = ["clang-format", "--style=file", "-i"]
+YAPF_CMD = ["yapf", "-i"]
+FLAKE_CMD = ["flake8"]
+
+
+class CodeFormatter:
+
+    def formatFiles(self, repos=None, diff_generator="HEAD", jobs=None):
+        repos = repos or get_environment().repos
+        modified_files = get_modified_files(repos, diff_generator, jobs)
+
+        work = []
+        for repo_root, files in modified_files.items():
+            yapf_supported_files = [
+                file for file in files
+                if self._isYapfSupported(file) and os.path.isfile(file)
+            ]
+            clang_supported_files = [
+                file for file in files
+                if self._isClangSupported(file) and os.path.isfile(file)
+            ]
+            if yapf_supported_files or clang_supported_files:
+                work.append((yapf_supported_files, clang_supported_files,
+                             FormatCache(repo_root)))
+        if not any(python_files for python_files, _, _ in work):
+            logging.info("No python files to format")
+        if not any(cpp_files for _, cpp_files, _ in work):
+            logging.info("No cpp files to format")
+
+        try:
+            diagnostics = self._runPipeline(work, jobs)
+        finally:
+            for _, _, cache in work:
+                cache.save()
+        for file in sorted(diagnostics):
+            if diagnostics[file]:
+                print(diagnostics[file])
+
+    def _runPipeline(self, work, jobs=None):
+        """
+        Format and lint the files on a pool of workers.
+
+        The file lists of every repo are split into shards; the python and
+        cpp shards are processed at the same time, and each python shard is
+        linted as soon as it has been formatted.
+
+        :param work: (python files, cpp files, FormatCache) for each repo
+        :return: flake8 diagnostics keyed by file
+        """
+        jobs = int(jobs or os.cpu_count() or 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = []
+            for python_files, cpp_files, cache in work:
+                futures += [
+                    pool.submit(self._formatPythonFiles, shard, cache)
+                    for shard in _shard(python_files, jobs)
+                ]
+                futures += [
+                    pool.submit(self._formatCppFiles, shard, cache)
+                    for shard in _shard(cpp_files, jobs)
+                ]
+            diagnostics = {}
+            for future in futures:
+                diagnostics.update(future.result())
+        return diagnostics
+
+    def _formatPythonFiles(self, files, cache):
+        self._runFormatter(YAPF_CMD, files, cache)
+        return self._lintPythonFiles(files, cache)
+
+    def _formatCppFiles(self, files, cache):
+        self._runFormatter(CLANG_CMD, files, cache)
+        return {}
+
+    def _runFormatter(self, cmd, files, cache):
+        tool = cmd[0]
+        stale_files = [file for file in files if cache.get(tool, file) is None]
+        if len(stale_files) < len(files):
+            logging.info(f"Skipping {len(files) - len(stale_files)} files "
+                         f"unchanged since last {tool} run")
+        if stale_files and run_cmd(cmd + stale_files,
+                                   check=False).returncode == 0:
+            for file in stale_files:
+                cache.put(tool, file)
+
+    def _lintPythonFiles(self, files, cache):
+        tool = FLAKE_CMD[0]
+        diagnostics = {}
+        stale_files = []
+        for file in files:
+            result = cache.get(tool, file)
+            if result is None:
+                stale_files.append(file)
+            else:
+                diagnostics[file] = result
+        if len(stale_files) < len(files):
+            logging.info(f"Reusing {tool} results for "
+                         f"{len(files) - len(stale_files)} unchanged files")
+
+        if stale_files:
+            # Shards are already linted in parallel, so keep flake8 itself
+            # from spawning a process per core for every shard.
+            cmd = FLAKE_CMD + ["--jobs=1"] + stale_files
+            logging.info(f"Command: {cmd}")
+            with span("flake8", files=len(stale_files)):
+                output = subprocess.run(cmd, capture_output=True, text=True)
+            if output.returncode not in (0, 1):
+                logging.error(output.stderr)
+                return diagnostics
+            lines = output.stdout.splitlines()
+            for file in stale_files:
+                diagnostics[file] = "\n".join(
+                    line for line in lines if line.startswith(file + ":"))
+                cache.put(tool, file, diagnostics[file])
+        return diagnostics
+
+    def _isClangSupported(self, file):
+        cpp_extensions = [".cpp", ".h", ".cxx", ".c", ".hpp"]
+        return any(file.endswith(extension) for extension in cpp_extensions)
+
+    def _isYapfSupported(self, file):
+        return file.endswith(".py") or file.endswith("wscript")
+
+
+@traced()
+def get_modified_files(repos, diff_generator, jobs=None):
+    """
+    Query every repo for the files changed relative to `diff_generator`,
+    plus any staged or untracked files.
+
+    Repos are queried concurrently. Repos sharing a git checkout (e.g.
+    maestro inside mmshare) are only queried once.
+
+    :return: absolute paths of the modified files keyed by the root of the
+        git checkout they belong to
+    """
+    for repo in repos:
+        if not _is_valid_repo(repo):
+            raise ValueError(f"Invalid repo: {repo}")
+
+    jobs = int(jobs or os.cpu_count() or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        repo_roots = set(
+            pool.map(get_git_root, map(get_environment().getRepoPath, repos)))
+        modified_files = pool.map(
+            lambda root: get_git_modified_files(root, diff_generator),
+            sorted(repo_roots))
+        return dict(zip(sorted(repo_roots), modified_files))
+
+
+def _shard(files, count):
+    """
+    Split `files` into at most `count` similarly sized shards.
+    """
+    count = min(count, len(files))
+    return [files[i::count] for i in range(count)]
+
+
+def _is_valid_repo(repo):
+    env = get_environment()
+    return os.path.isdir(env.getRepoPath(repo)) and repo in env.repos
@@ -0,0 +1,55 @@
+"""
+Helpers for querying git checkouts without changing the working directory.
+"""
+import os
+import subprocess
+
+from telemetry import span
+
+
+def run_git(args, cwd):
+    with span(f"git {args[0]}", cwd=cwd):
+        return subprocess.check_output(["git"] + args,
+                                       cwd=cwd).decode("utf-8")
+
+
+def get_git_root(path):
+    return os.path.normpath(
+        run_git(["rev-parse", "--show-toplevel"], cwd=path).strip())
+
+
+def get_git_status_files(path):
+    """
+    Return the absolute paths of the files under `path` that are staged,
+    modified, deleted or untracked in the work tree.
+    """
+    repo_root = get_git_root(path)
+    files = set()
+    # Entries look like "XY path", renames and copies are followed by an
+    # extra entry holding the original path.
+    entries = iter(
+        run_git([
+            "status", "--porcelain", "-z", "--untracked-files=all", "--", "."
+        ],
+                cwd=path).split("\0"))
+    for entry in entries:
+        if not entry:
+            continue
+        status, file = entry[:2], entry[3:]
+        files.add(os.path.join(repo_root, file))
+        if "R" in status or "C" in status:
+            next(entries, None)
+    return sorted(files)
+
+
+def get_git_modified_files(repo_root, diff_generator):
+    """
+    Return the absolute paths of the files that differ from `diff_generator`
+    or that are staged, modified or untracked in the work tree.
+    """
+    files = set(
+        os.path.join(repo_root, file) for file in run_git(
+            ["diff", "--name-only", "-z", diff_generator],
+            cwd=repo_root).split("\0") if file)
+    files.update(get_git_status_files(repo_root))
+    return sorted(files)
@@ -0,0 +1,295 @@
+"""
+Select the tests affected by a change, and balance them across workers.
+
+Affected tests are found through the import graph of the Python files in the
+repos: a test is selected when it, or any module it imports directly or
+indirectly, changed. The imports of every file are cached by size and mtime,
+so only files changed since the last selection are parsed again. Changes the
+graph cannot see (C++ sources, data files, ...) select every test.
+
+The wall time of every test file is recorded after each run, so the next
+selection can be split into shards of about equal duration.
+"""
+import ast
+import collections
+import logging
+import os
+import statistics
+
+from cmd_runner import LOG_DIR
+from git_utils import get_git_status_files, run_git
+from json_cache import load_json, write_json_atomic
+from telemetry import traced
+
+GRAPH_FILE_NAME = "import_graph.json"
+DURATIONS_FILE_NAME = "test_durations.json"
+GRAPH_VERSION = 1
+# Duration assumed for tests that never ran, when no test has run yet
+DEFAULT_DURATION = 1.0
+
+ImportSpec = collections.namedtuple("ImportSpec", ["level", "module", "names"])
+
+
+def is_test_file(path):
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_")
+                                     or name.endswith("_test.py"))
+
+
+def find_test_files(test_path):
+    if os.path.isfile(test_path):
+        return [os.path.abspath(test_path)]
+    return sorted(
+        os.path.abspath(os.path.join(root, name))
+        for root, _, files in os.walk(test_path) for name in files
+        if is_test_file(name))
+
+
+def get_python_files(repo_root):
+    """
+    :return: absolute paths of the tracked and untracked Python files of a
+        git checkout
+    """
+    files = set(
+        os.path.join(repo_root, file) for file in run_git(
+            ["ls-files", "-z", "--", "*.py"], cwd=repo_root).split("\0")
+        if file)
+    files.update(file for file in get_git_status_files(repo_root)
+                 if file.endswith(".py"))
+    return sorted(file for file in files if os.path.isfile(file))
+
+
+def parse_imports(path):
+    """
+    :return: list of ImportSpec of the imports anywhere in a Python file
+    """
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports += [ImportSpec(0, alias.name, []) for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            imports.append(
+                ImportSpec(node.level, node.module or "",
+                           [alias.name for alias in node.names]))
+    return imports
+
+
+def _get_module_parts(path):
+    parts = os.path.splitext(path)[0].split(os.sep)
+    if parts[-1] == "__init__":
+        parts.pop()
+    return parts
+
+
+class ImportGraph:
+    """
+    Import graph of a set of Python files, cached in `graph_file`.
+
+    Modules are resolved by their dotted path, matched against every dotted
+    suffix of the file paths, since the import roots of the repos are not
+    known. An ambiguous module resolves to all its candidates, so ambiguity
+    can only select more tests, never fewer.
+    """
+
+    def __init__(self, graph_file=None):
+        self._graph_file = graph_file or os.path.join(LOG_DIR, GRAPH_FILE_NAME)
+        self._entries = self._load()
+        self._dirty = False
+        self._modules = collections.defaultdict(list)
+        self._known = set()
+        self._imports = {}
+
+    @traced("build import graph")
+    def build(self, paths, removed_files=()):
+        """
+        Index the imports of `paths`, parsing only the files that changed
+        since they were cached.
+
+        :param removed_files: deleted Python files, still resolved as
+            modules so that the files importing them are affected
+        """
+        entries = {}
+        parsed = 0
+        for path in paths:
+            stat = os.stat(path)
+            entry = self._entries.get(path)
+            if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+                try:
+                    imports = parse_imports(path)
+                except (SyntaxError, ValueError) as err:
+                    logging.debug(f"Could not parse {path}: {err}")
+                    imports = []
+                entry = [stat.st_size, stat.st_mtime_ns, imports]
+                parsed += 1
+            entries[path] = entry
+        logging.info(f"Parsed the imports of {parsed} new or changed Python "
+                     f"files, reused {len(paths) - parsed} from "
+                     f"{self._graph_file}")
+        if parsed or entries.keys() != self._entries.keys():
+            self._entries = entries
+            self._dirty = True
+
+        self._modules.clear()
+        self._known = set(entries).union(removed_files)
+        for path in self._known:
+            parts = _get_module_parts(path)
+            for i in range(1, len(parts)):
+                self._modules[".".join(parts[-i:])].append(path)
+        self._imports = {
+            path: self._resolve(path, [ImportSpec(*spec) for spec in entry[2]])
+            for path, entry in entries.items()
+        }
+
+    def getAffectedFiles(self, changed_files):
+        """
+        :return: set of the changed files and the files importing them,
+            directly or indirectly
+        """
+        importers = collections.defaultdict(set)
+        for path, imported in self._imports.items():
+            for module_path in imported:
+                importers[module_path].add(path)
+        affected = set(changed_files)
+        pending = list(affected)
+        while pending:
+            for importer in importers[pending.pop()]:
+                if importer not in affected:
+                    affected.add(importer)
+                    pending.append(importer)
+        return affected
+
+    def save(self):
+        if not self._dirty:
+            return
+        write_json_atomic(self._graph_file, {
+            "version": GRAPH_VERSION,
+            "files": self._entries
+        })
+        self._dirty = False
+
+    def _resolve(self, path, imports):
+        """
+        :return: set of the indexed files imported by `path`
+        """
+        resolved = set()
+        for spec in imports:
+            if spec.level:
+                base = os.path.dirname(path)
+                for _ in range(spec.level - 1):
+                    base = os.path.dirname(base)
+                module_dir = base
+                if spec.module:
+                    module_dir = os.path.join(base, *spec.module.split("."))
+                candidates = [
+                    os.path.join(module_dir, name + ".py")
+                    for name in spec.names
+                ] + [
+                    module_dir + ".py",
+                    os.path.join(module_dir, "__init__.py")
+                ]
+                resolved.update(candidate for candidate in candidates
+                                if candidate in self._known)
+                continue
+            names = [f"{spec.module}.{name}" for name in spec.names]
+            for name in names or [spec.module]:
+                resolved.update(self._findModule(name))
+        resolved.discard(path)
+        return resolved
+
+    def _findModule(self, name):
+        """
+        :return: files of the longest prefix of the dotted `name` that is
+            an indexed module
+        """
+        parts = name.split(".")
+        while parts:
+            candidates = self._modules.get(".".join(parts))
+            if candidates:
+                return candidates
+            parts.pop()
+        return []
+
+    def _load(self):
+        data = load_json(self._graph_file, {})
+        if data.get("version") != GRAPH_VERSION:
+            return {}
+        return data.get("files", {})
+
+
+class TestDurations:
+    """
+    Wall time of every test file over its previous runs, kept as a moving
+    average in `durations_file`.
+    """
+
+    def __init__(self, durations_file=None):
+        self._durations_file = durations_file or os.path.join(
+            LOG_DIR, DURATIONS_FILE_NAME)
+        self._durations = self._load()
+        self._dirty = False
+
+    def getWeights(self, test_files):
+        """
+        :return: expected duration of every test file; tests that never ran
+            get the median duration of those that did
+        """
+        known = [
+            self._durations[file] for file in test_files
+            if file in self._durations
+        ]
+        default = statistics.median(known) if known else DEFAULT_DURATION
+        return {
+            file: self._durations.get(file, default)
+            for file in test_files
+        }
+
+    def record(self, test_file, seconds):
+        previous = self._durations.get(test_file)
+        self._durations[test_file] = seconds if previous is None else (
+            previous + seconds) / 2
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        write_json_atomic(self._durations_file, self._durations)
+        self._dirty = False
+
+    def _load(self):
+        return load_json(self._durations_file, {})
+
+
+def select_tests(test_files, modified_files):
+    """
+    :param test_files: absolute paths of the candidate test files
+    :param modified_files: absolute paths of the modified files keyed by the
+        root of their git checkout, see `formatter.get_modified_files`
+    :return: the test files affected by the modified files
+    """
+    unmapped = [
+        file for files in modified_files.values() for file in files
+        if not file.endswith(".py")
+    ]
+    if unmapped:
+        logging.info(f"Running all {len(test_files)} tests, "
+                     f"{len(unmapped)} modified files are not Python "
+                     f"modules: {unmapped[:10]}")
+        return list(test_files)
+
+    changed_files = [
+        file for files in modified_files.values() for file in files
+    ]
+    paths = set(test_files)
+    for repo_root in modified_files:
+        paths.update(get_python_files(repo_root))
+    graph = ImportGraph()
+    graph.build(sorted(paths),
+                [file for file in changed_files if not os.path.exists(file)])
+    graph.save()
+    affected = graph.getAffectedFiles(changed_files)
+    selected = [file for file in test_files if file in affected]
+    logging.info(f"Selected {len(selected)} of {len(test_files)} tests "
+                 "affected by the modified files")
+    return selected
@@ -1,31 +1,292 @@
-from schrodinger.infra import jobhub
-from schrodinger.Qt import QtCore
+"""
+Track the jobs started and completed by the JobHub job manager.
+
+The tracker keeps running counters and records the start and end time of
+every job in a fixed size ring buffer, so handling an event costs O(1) no
+matter how many jobs the campaign has. Event lines are written by a
+background thread, keeping the signal handlers free of I/O, and closing the
+tracker prints the job latency percentiles and throughput.
+
+The job manager is reached through a `JobEventSource`, so the tracker can
+also be driven by `SyntheticEventSource`, e.g. to benchmark it without a
+Schrodinger installation:
+
+    python job_utils.py --synthetic-jobs 100000
+"""
+import abc
+import array
+import collections
+import math
+import queue
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+from stats import percentile
+
+DEFAULT_CAPACITY = 100000
+
+TrackerSummary = collections.namedtuple("TrackerSummary", [
+    "started", "completed", "running", "p50_ms", "p90_ms", "p99_ms", "max_ms",
+    "jobs_per_second"
+])
+
+
+class JobEventSource(abc.ABC):
+    """
+    Interface to the job events the tracker listens to.
+    """
+
+    @abc.abstractmethod
+    def connect(self, on_started, on_completed):
+        """
+        Call `on_started(job_id)` and `on_completed(job_id)` for every job
+        started and completed from now on.
+        """
+
+    @abc.abstractmethod
+    def getJobCount(self):
+        """
+        :return: number of jobs known to the job manager
+        """
+
+
+class JobHubEventSource(JobEventSource):
+    """
+    Job events of the JobHub job manager of the running Maestro.
+    """
+
+    def __init__(self):
+        # Imported here so the tracker can be used without Schrodinger.
+        from schrodinger.infra import jobhub
+        self._jobhub = jobhub
+        self._job_manager = jobhub.get_job_manager()
+
+    def connect(self, on_started, on_completed):
+        self._job_manager.jobStarted.connect(
+            lambda job: on_started(job.job_id))
+        self._job_manager.jobCompleted.connect(
+            lambda job: on_completed(job.job_id))
+
+    def getJobCount(self):
+        return len(self._job_manager.getJobs(self._jobhub.JobOption.ALL_JOBS))
+
+
+class SyntheticEventSource(JobEventSource):
+    """
+    Emits the events of `count` jobs with random durations, running up to
+    `concurrency` of them at a time.
+    """
+
+    def __init__(self, count, concurrency=100, mean_duration=0.001, seed=0):
+        self._count = count
+        self._concurrency = concurrency
+        self._mean_duration = mean_duration
+        self._random = random.Random(seed)
+        self._callbacks = []
+
+    def connect(self, on_started, on_completed):
+        self._callbacks.append((on_started, on_completed))
+
+    def getJobCount(self):
+        return self._count
+
+    def run(self):
+        """
+        Emit all events, sleeping for the simulated job durations.
+        """
+        running = []
+        for i in range(self._count):
+            job_id = f"synthetic-{i}"
+            self._emit(0, job_id)
+            duration = 0.0
+            if self._mean_duration:
+                duration = self._random.expovariate(1 / self._mean_duration)
+            running.append((time.monotonic() + duration, job_id))
+            if len(running) >= self._concurrency:
+                running.sort(reverse=True)
+                self._complete(*running.pop())
+        for end, job_id in sorted(running):
+            self._complete(end, job_id)
+
+    def _complete(self, end, job_id):
+        delay = end - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._emit(1, job_id)
+
+    def _emit(self, event, job_id):
+        for callbacks in self._callbacks:
+            callbacks[event](job_id)
+
+
+class _JobRecords:
+    """
+    Ring buffer of job start and end times. Once full, the oldest job is
+    overwritten.
+    """
+    __slots__ = ("_ids", "_starts", "_ends", "_slots", "_next")
+
+    def __init__(self, capacity):
+        self._ids = [None] * capacity
+        self._starts = array.array("d", [math.nan]) * capacity
+        self._ends = array.array("d", [math.nan]) * capacity
+        self._slots = {}
+        self._next = 0
+
+    def start(self, job_id, now):
+        slot = self._next
+        self._next = (slot + 1) % len(self._ids)
+        old_id = self._ids[slot]
+        if old_id is not None and self._slots.get(old_id) == slot:
+            del self._slots[old_id]
+        self._ids[slot] = job_id
+        self._starts[slot] = now
+        self._ends[slot] = math.nan
+        self._slots[job_id] = slot
+
+    def end(self, job_id, now):
+        """
+        :return: duration of the job in seconds, or None if its start was
+            not recorded
+        """
+        slot = self._slots.get(job_id)
+        if slot is None:
+            return None
+        self._ends[slot] = now
+        return now - self._starts[slot]
+
+    def getDurations(self):
+        return [
+            end - start for start, end in zip(self._starts, self._ends)
+            if not math.isnan(end)
+        ]
+
+    def getTimeSpan(self):
+        """
+        :return: (first start, last end) of the recorded jobs
+        """
+        starts = [start for start in self._starts if not math.isnan(start)]
+        ends = [end for end in self._ends if not math.isnan(end)]
+        if not starts or not ends:
+            return None
+        return min(starts), max(ends)
 
 
 class JobTracker:
-    def __init__(self, job_id):
+
+    def __init__(self,
+                 job_id,
+                 source=None,
+                 capacity=DEFAULT_CAPACITY,
+                 stream=None,
+                 verbose=True):
+        """
+        :param job_id: label of the tracked campaign in the output
+        :param source: JobEventSource, by default the JobHub job manager
+        :param capacity: number of most recent jobs whose times are kept
+        :param stream: where to write the output, stdout by default
+        :param verbose: whether to write a line for every job event
+        """
         self._job_id = job_id
-        self._timer = QtCore.QElapsedTimer()
-        self._timer.start()
-        job_manager = jobhub.get_job_manager()
-        print("Before starting job")
-        self._printAllJobsCount()
-        job_manager.jobCompleted.connect(self._onJobCompleted)
-        job_manager.jobStarted.connect(self._onJobStarted)
-        print(f"Timer started for job {job_id}")
-
-    def _printAllJobsCount(self):
-        job_manager = jobhub.get_job_manager()
-        print(f"Job count: {len(job_manager.getJobs(jobhub.JobOption.ALL_JOBS))}")
-
-    def _onJobCompleted(self, job):
-        print("Inside Job completed")
-        print(f"Job {job.job_id} completed in {self._timer.elapsed()} ms")
-        self._printAllJobsCount()
-        print("Exiting Job completed")
-
-    def _onJobStarted(self, job):
-        print("Inside Job started")
-        self._printAllJobsCount()
-        print(f"Job {job.job_id} started in {self._timer.elapsed()} ms")
-        print("Exiting Job started")
\ No newline at end of file
+        self._source = source or JobHubEventSource()
+        self._records = _JobRecords(capacity)
+        self._started = 0
+        self._completed = 0
+        self._verbose = verbose
+        self._start = time.monotonic()
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write,
+                                        args=(stream or sys.stdout, ),
+                                        daemon=True)
+        self._writer.start()
+        self._queue.put(
+            f"Job count before start: {self._source.getJobCount()}")
+        self._source.connect(self._onJobStarted, self._onJobCompleted)
+        self._queue.put(f"Timer started for job {job_id}")
+
+    def getSummary(self):
+        durations = sorted(self._records.getDurations())
+        latencies = [0.0] * 4
+        if durations:
+            latencies = [
+                percentile(durations, fraction) * 1000
+                for fraction in (0.5, 0.9, 0.99, 1.0)
+            ]
+        throughput = 0.0
+        time_span = self._records.getTimeSpan()
+        if time_span and time_span[1] > time_span[0]:
+            throughput = len(durations) / (time_span[1] - time_span[0])
+        return TrackerSummary(self._started, self._completed,
+                              self._started - self._completed, *latencies,
+                              throughput)
+
+    def close(self):
+        """
+        Write the summary and wait for the output to be flushed.
+        """
+        summary = self.getSummary()
+        self._queue.put(
+            f"Jobs of {self._job_id}: {summary.started} started, "
+            f"{summary.completed} completed, {summary.running} running")
+        self._queue.put(
+            f"Job latency: p50 {summary.p50_ms:.1f} ms, p90 "
+            f"{summary.p90_ms:.1f} ms, p99 {summary.p99_ms:.1f} ms, max "
+            f"{summary.max_ms:.1f} ms; throughput "
+            f"{summary.jobs_per_second:.1f} jobs/s")
+        self._queue.put(None)
+        self._writer.join()
+        return summary
+
+    def _onJobStarted(self, job_id):
+        now = time.monotonic()
+        self._started += 1
+        self._records.start(job_id, now)
+        if self._verbose:
+            self._queue.put((job_id, "started", now, None))
+
+    def _onJobCompleted(self, job_id):
+        now = time.monotonic()
+        self._completed += 1
+        duration = self._records.end(job_id, now)
+        if self._verbose:
+            self._queue.put((job_id, "completed", now, duration))
+
+    def _write(self, stream):
+        while (item := self._queue.get()) is not None:
+            if isinstance(item, str):
+                stream.write(item + "\n")
+                continue
+            job_id, event, now, duration = item
+            line = (f"Job {job_id} {event} at "
+                    f"{(now - self._start) * 1000:.0f} ms")
+            if duration is not None:
+                line += f" after {duration * 1000:.0f} ms"
+            stream.write(line + "\n")
+        stream.flush()
+
+
+def main():
+    parser = ArgumentParser(
+        description="Drive the job tracker with synthetic job events")
+    parser.add_argument("--synthetic-jobs", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--mean-duration-ms", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    source = SyntheticEventSource(args.synthetic_jobs, args.concurrency,
+                                  args.mean_duration_ms / 1000)
+    tracker = JobTracker("synthetic", source, verbose=args.verbose)
+    start = time.perf_counter()
+    source.run()
+    elapsed = time.perf_counter() - start
+    tracker.close()
+    print(f"Handled {2 * args.synthetic_jobs} events in {elapsed:.2f} s "
+          f"({2 * args.synthetic_jobs / elapsed:.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,274 @@
+"""
+Benchmark subjob lookup on the JobHub job manager.
+
+Measures the latency of looking up the subjobs and the whole subjob tree of
+every job over growing numbers of jobs, once by reading `job.SubJobs` for
+every lookup and once through `CachedSubjobResolver`, which resolves the
+subjob trees of all jobs in one batch and keeps them until the job manager
+emits `jobsChanged`. With synthetic jobs the benchmark also emits
+`jobsChanged` and times resolving every tree again.
+
+Run inside Maestro's Python with jobs in the job manager, or on synthetic
+jobs without Schrodinger:
+
+    python jobhub_debug.py --synthetic-jobs 20000 --lookup-cost-us 20
+"""
 import sys
 import time
+from argparse import ArgumentParser
+
+from stats import percentile
+
+DEFAULT_SIZES = (100, 1000, 10000)
+
+
+class CachedSubjobResolver:
+    """
+    Memoized subjob trees of the jobs in the job manager.
+    """
+
+    def __init__(self, job_manager=None):
+        """
+        :param job_manager: job manager whose `jobsChanged` signal
+            invalidates the cache, if any
+        """
+        self._subjobs = {}
+        self._trees = {}
+        if job_manager is not None:
+            job_manager.jobsChanged.connect(self.invalidate)
+
+    def invalidate(self, *args):
+        self._subjobs.clear()
+        self._trees.clear()
+
+    def isCached(self):
+        """
+        :return: whether any subjobs or subjob trees are cached
+        """
+        return bool(self._subjobs or self._trees)
+
+    def resolveAll(self, jobs):
+        """
+        Read the subjobs of all `jobs` in one pass.
+        """
+        for job in jobs:
+            self._subjobs[job.job_id] = tuple(job.SubJobs)
+
+    def getSubjobs(self, job):
+        subjobs = self._subjobs.get(job.job_id)
+        if subjobs is None:
+            subjobs = self._subjobs[job.job_id] = tuple(job.SubJobs)
+        return subjobs
+
+    def getSubjobTree(self, job_id):
+        """
+        :return: ids of all direct and indirect subjobs of a resolved job
+        """
+        tree = self._trees.get(job_id)
+        if tree is None:
+            tree = []
+            for subjob_id in self._subjobs.get(job_id, ()):
+                tree.append(subjob_id)
+                tree.extend(self.getSubjobTree(subjob_id))
+            tree = self._trees[job_id] = tuple(tree)
+        return tree
+
+
+class _Signal:
+    """
+    Minimal stand-in for a Qt signal.
+    """
+
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot):
+        self._slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class SyntheticJobManager:
+    """
+    Stand-in for the JobHub job manager, holding synthetic jobs.
+    """
 
-from schrodinger.infra import jobhub
+    def __init__(self, jobs):
+        self.jobsChanged = _Signal()
+        self._jobs = jobs
 
+    def getJobs(self, option=None):
+        return list(self._jobs)
 
-def get_subjobs(jobs):
-    start = time.time()
-    total_jobs = 0
 
+class SyntheticJob:
+    """
+    Stand-in for a JobHub job whose `SubJobs` costs `lookup_cost_us` of busy
+    waiting to read, like a call into the job manager.
+    """
+
+    def __init__(self, job_id, subjobs, lookup_cost_us=0.0):
+        self.job_id = job_id
+        self._subjobs = subjobs
+        self._lookup_cost = lookup_cost_us / 1e6
+
+    @property
+    def SubJobs(self):
+        end = time.perf_counter() + self._lookup_cost
+        while time.perf_counter() < end:
+            pass
+        return list(self._subjobs)
+
+
+def make_synthetic_jobs(count, fanout=4, lookup_cost_us=0.0):
+    """
+    :return: `count` jobs forming trees in which every job has up to `fanout`
+        subjobs
+    """
+    subjobs = [[] for _ in range(count)]
+    for i in range(1, count):
+        subjobs[(i - 1) // fanout].append(f"job-{i}")
+    return [
+        SyntheticJob(f"job-{i}", subjobs[i], lookup_cost_us)
+        for i in range(count)
+    ]
+
+
+def time_lookups(jobs, get_subjobs):
+    """
+    :return: (sorted latencies of each lookup in microseconds, total number
+        of subjobs found)
+    """
+    latencies = []
+    total_subjobs = 0
     for job in jobs:
-        subjobs = job.SubJobs
-    
-    print(f"Time taken to get subjobs of {len(jobs)} jobs is:",
-          time.time() - start)
-    print("total jobs via sub jobs", total_jobs)
-    sys.exit(0)
+        start = time.perf_counter_ns()
+        subjobs = get_subjobs(job)
+        latencies.append((time.perf_counter_ns() - start) / 1000)
+        total_subjobs += len(subjobs)
+    latencies.sort()
+    return latencies, total_subjobs
+
+
+def get_subjob_tree(jobs_by_id, job):
+    """
+    :return: ids of all direct and indirect subjobs of `job` among
+        `jobs_by_id`, reading `SubJobs` of every job in the tree
+    """
+    tree = []
+    for subjob_id in job.SubJobs:
+        tree.append(subjob_id)
+        subjob = jobs_by_id.get(subjob_id)
+        if subjob is not None:
+            tree.extend(get_subjob_tree(jobs_by_id, subjob))
+    return tree
+
+
+def benchmark(jobs, sizes=DEFAULT_SIZES, job_manager=None):
+    """
+    Print the subjob and subjob tree lookup latencies of the serial and the
+    cached resolution for the first N jobs, for every N in `sizes`.
+
+    :param job_manager: job manager the cached resolver is connected to. If
+        given, its `jobsChanged` signal is emitted after the cached lookups
+        to time resolving all trees again, so only pass a
+        SyntheticJobManager.
+    """
+    print(f"{'Jobs':>7} {'Resolver':<11} {'p50 us':>8} {'p95 us':>8} "
+          f"{'max us':>9} {'total ms':>9} {'subjobs':>8}")
+    for size in sorted(set(min(size, len(jobs)) for size in sizes)):
+        if size <= 0:
+            print(f"{size:>7} skipped, no jobs to look up")
+            continue
+        subset = jobs[:size]
+        serial, serial_subjobs = time_lookups(subset, lambda job: job.SubJobs)
+        _print_row(size, "serial", serial, serial_subjobs)
 
+        resolver = CachedSubjobResolver(job_manager)
+        start = time.perf_counter_ns()
+        resolver.resolveAll(subset)
+        batch_ms = (time.perf_counter_ns() - start) / 1e6
+        cached, cached_subjobs = time_lookups(subset, resolver.getSubjobs)
+        _print_row(size, "cached", cached, cached_subjobs,
+                   f" + {batch_ms:.1f} ms batch")
 
-def main():
+        cached_total = sum(cached) / 1000 + batch_ms
+        speedup = sum(serial) / 1000 / cached_total if cached_total else 0
+        print(f"{'':>7} speedup {speedup:.1f}x including the batch, "
+              f"{sum(serial) / max(sum(cached), 1e-9):.0f}x once cached")
+
+        jobs_by_id = {job.job_id: job for job in subset}
+        serial_trees, serial_tree_subjobs = time_lookups(
+            subset, lambda job: get_subjob_tree(jobs_by_id, job))
+        _print_row(size, "tree", serial_trees, serial_tree_subjobs)
+        cached_trees, cached_tree_subjobs = time_lookups(
+            subset, lambda job: resolver.getSubjobTree(job.job_id))
+        _print_row(size, "tree cached", cached_trees, cached_tree_subjobs)
+
+        if job_manager is not None:
+            start = time.perf_counter_ns()
+            job_manager.jobsChanged.emit()
+            if resolver.isCached():
+                raise RuntimeError("jobsChanged did not invalidate the "
+                                   "cached subjob trees")
+            resolver.resolveAll(subset)
+            for job in subset:
+                resolver.getSubjobTree(job.job_id)
+            refresh_ms = (time.perf_counter_ns() - start) / 1e6
+            print(f"{'':>7} jobsChanged: all {size} trees resolved again in "
+                  f"{refresh_ms:.1f} ms")
+            job_manager.jobsChanged.disconnect(resolver.invalidate)
+
+
+def _print_row(size, name, latencies, subjobs, suffix=""):
+    print(f"{size:>7} {name:<11} {percentile(latencies, 0.5):>8.2f} "
+          f"{percentile(latencies, 0.95):>8.2f} {latencies[-1]:>9.2f} "
+          f"{sum(latencies) / 1000:>9.2f} {subjobs:>8}{suffix}")
+
+
+def parse_args():
+    parser = ArgumentParser(description="Benchmark subjob lookup")
+    parser.add_argument("--sizes",
+                        type=int,
+                        nargs="+",
+                        default=DEFAULT_SIZES,
+                        help="Numbers of jobs to look up (default: "
+                        f"{' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("--synthetic-jobs",
+                        type=int,
+                        help="Benchmark this many synthetic jobs instead of "
+                        "the jobs of the job manager")
+    parser.add_argument("--lookup-cost-us",
+                        type=float,
+                        default=0.0,
+                        help="Simulated cost of reading the subjobs of a "
+                        "synthetic job")
+    return parser.parse_args()
+
+
+def main(args):
+    from schrodinger.infra import jobhub
     jm = jobhub.get_job_manager()
-    jm.jobsChanged.connect(get_subjobs)
+
+    def on_jobs_changed(*_):
+        jm.jobsChanged.disconnect(on_jobs_changed)
+        benchmark(jm.getJobs(jobhub.JobOption.ALL_JOBS), args.sizes)
+        sys.exit(0)
+
+    jm.jobsChanged.connect(on_jobs_changed)
 
 
 if __name__ == '__main__':
-    from schrodinger.utils import qapplication
-    qapplication.start_application(main)
\ No newline at end of file
+    args = parse_args()
+    if args.synthetic_jobs:
+        jobs = make_synthetic_jobs(args.synthetic_jobs,
+                                   lookup_cost_us=args.lookup_cost_us)
+        benchmark(jobs, args.sizes, SyntheticJobManager(jobs))
+    else:
+        from schrodinger.utils import qapplication
+        qapplication.start_application(lambda: main(args))
@@ -1,17 +1,265 @@
-from schrodinger.tasks import jobtasks
-from schrodinger.infra import mmjob
-from schrodinger.utils import qapplication
-from schrodinger.utils import preferences
- 
- 
-#pref_handler = preferences.Preferences(preferences.SHARED)
-#pref_handler.set("jobcontrol/update_notify_count", 50000)
- 
-app = qapplication.get_application()
-mmjob.timing_debug_on()
- 
- 
-task = jobtasks.CmdJobTask(cmd_list=['testapp', '-t', '1','-PROJ',"/Users/mishra/delme/test_2.prj"])
-task.start()
-task.wait()
+"""
+Job launch throughput benchmark.
 
+Launches a storm of tasks with a bounded number in flight, and measures for
+every task its submit latency (how long launching blocked), time to start
+and time to complete, both measured from submission. The storm can be
+repeated for several values of the `jobcontrol/update_notify_count`
+preference, and the results are written as a JSON report.
+
+Tasks are launched through a backend: `jobtask` runs real
+`jobtasks.CmdJobTask`s, `subprocess` runs the command as a local process
+so the benchmark also runs on machines without Schrodinger. A local process
+has started once launching it returns, so the `subprocess` backend reports
+no time to start.
+
+    python jobtask.py --backend subprocess --tasks 200 --concurrency 20 \\
+        --report launch.json -- sleep 0.1
+"""
+import json
+import logging
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, ArgumentTypeError
+
+from stats import summarize
+
+NOTIFY_COUNT_PREF = "jobcontrol/update_notify_count"
+DEFAULT_CMD = ["testapp", "-t", "1"]
+POLL_INTERVAL = 0.005
+
+
+class SubprocessBackend:
+    """
+    Runs every task as a local process.
+    """
+    name = "subprocess"
+    # Popen only returns once the command was executed
+    reports_start = False
+
+    def launch(self, cmd):
+        return subprocess.Popen(cmd,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+
+    def isDone(self, proc):
+        return proc.poll() is not None
+
+    def isSuccess(self, proc):
+        return proc.returncode == 0
+
+    def processEvents(self):
+        pass
+
+    def setNotifyCount(self, count):
+        logging.warning(f"The {self.name} backend ignores {NOTIFY_COUNT_PREF}")
+
+    def restore(self):
+        pass
+
+
+class JobTaskBackend:
+    """
+    Runs every task as a `jobtasks.CmdJobTask`.
+    """
+    name = "jobtask"
+    reports_start = True
+
+    def __init__(self, timing_debug=False):
+        # Imported here so the subprocess backend works without Schrodinger.
+        from schrodinger.infra import mmjob
+        from schrodinger.tasks import jobtasks
+        from schrodinger.tasks import tasks
+        from schrodinger.utils import preferences
+        from schrodinger.utils import qapplication
+        self._jobtasks = jobtasks
+        self._status = tasks.Status
+        self._app = qapplication.get_application()
+        self._prefs = preferences.Preferences(preferences.SHARED)
+        self._original_notify_count = self._prefs.get(NOTIFY_COUNT_PREF, None)
+        if timing_debug:
+            mmjob.timing_debug_on()
+
+    def launch(self, cmd):
+        task = self._jobtasks.CmdJobTask(cmd_list=cmd)
+        task.start()
+        return task
+
+    def isStarted(self, task):
+        return task.status != self._status.WAITING
+
+    def isDone(self, task):
+        return task.status in (self._status.DONE, self._status.FAILED)
+
+    def isSuccess(self, task):
+        return task.status == self._status.DONE
+
+    def processEvents(self):
+        self._app.processEvents()
+
+    def setNotifyCount(self, count):
+        self._prefs.set(NOTIFY_COUNT_PREF, count)
+
+    def restore(self):
+        if self._original_notify_count is None:
+            self._prefs.remove(NOTIFY_COUNT_PREF)
+        else:
+            self._prefs.set(NOTIFY_COUNT_PREF, self._original_notify_count)
+
+
+class _Launch:
+    __slots__ = ("handle", "submitted", "submit_latency", "started", "done")
+
+    def __init__(self, handle, submitted, submit_latency):
+        self.handle = handle
+        self.submitted = submitted
+        self.submit_latency = submit_latency
+        self.started = None
+        self.done = None
+
+
+def run_storm(backend, cmd, count, concurrency):
+    """
+    Launch `count` tasks running `cmd`, at most `concurrency` at a time.
+
+    :return: dict of the storm's wall time, throughput, failures and the
+        summaries of the submit latency of every task, and of the time to
+        start and time to complete of the tasks that succeeded, in
+        milliseconds; summaries without any task, and the time to start of
+        backends not reporting it, are None
+    :raise ValueError: if `concurrency` is less than 1
+    """
+    if concurrency < 1:
+        raise ValueError(f"Concurrency must be at least 1, got {concurrency}")
+    pending = count
+    in_flight = []
+    finished = []
+    start = time.perf_counter()
+    while pending or in_flight:
+        while pending and len(in_flight) < concurrency:
+            submitted = time.perf_counter()
+            handle = backend.launch(cmd)
+            in_flight.append(
+                _Launch(handle, submitted,
+                        time.perf_counter() - submitted))
+            pending -= 1
+
+        backend.processEvents()
+        now = time.perf_counter()
+        still_running = []
+        for launch in in_flight:
+            if (backend.reports_start and launch.started is None
+                    and backend.isStarted(launch.handle)):
+                launch.started = now
+            if backend.isDone(launch.handle):
+                launch.done = now
+                finished.append(launch)
+            else:
+                still_running.append(launch)
+        if len(still_running) == len(in_flight):
+            time.sleep(POLL_INTERVAL)
+        in_flight = still_running
+    wall_time = time.perf_counter() - start
+
+    def summary(values):
+        if not values:
+            return None
+        return {
+            name: round(value * 1000, 3) if name != "count" else value
+            for name, value in summarize(values)._asdict().items()
+        }
+
+    succeeded = [
+        launch for launch in finished if backend.isSuccess(launch.handle)
+    ]
+    start_times = []
+    if backend.reports_start:
+        # A task that finished between two polls also started then.
+        start_times = [(launch.started or launch.done) - launch.submitted
+                       for launch in succeeded]
+    complete_times = [launch.done - launch.submitted for launch in succeeded]
+    return {
+        "wall_s": round(wall_time, 3),
+        "tasks_per_s": round(count / wall_time, 2) if wall_time else 0.0,
+        "failures": len(finished) - len(succeeded),
+        "submit_ms": summary([launch.submit_latency for launch in finished]),
+        "start_ms": summary(start_times),
+        "complete_ms": summary(complete_times),
+    }
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="Benchmark launching many jobs",
+        epilog="The command to launch follows '--' (default: "
+        f"{' '.join(DEFAULT_CMD)})")
+    parser.add_argument("--backend",
+                        choices=("jobtask", "subprocess"),
+                        default="jobtask")
+    parser.add_argument("--tasks", type=positive_int, default=50)
+    parser.add_argument("--concurrency", type=positive_int, default=10)
+    parser.add_argument("--notify-counts",
+                        type=int,
+                        nargs="+",
+                        metavar="COUNT",
+                        help=f"Values of {NOTIFY_COUNT_PREF} to sweep "
+                        "(default: leave the preference unchanged)")
+    parser.add_argument("--timing-debug",
+                        action="store_true",
+                        help="Turn on the job control timing debug output")
+    parser.add_argument("--report",
+                        metavar="FILE",
+                        help="Write the results as JSON to FILE instead of "
+                        "stdout")
+    parser.add_argument("cmd", nargs="*", default=DEFAULT_CMD)
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.backend == "jobtask":
+        backend = JobTaskBackend(args.timing_debug)
+    else:
+        backend = SubprocessBackend()
+
+    runs = []
+    try:
+        for notify_count in args.notify_counts or [None]:
+            if notify_count is not None:
+                backend.setNotifyCount(notify_count)
+            result = run_storm(backend, args.cmd, args.tasks, args.concurrency)
+            median = (result["complete_ms"] or {}).get("median")
+            logging.info(f"Notify count {notify_count}: "
+                         f"{result['tasks_per_s']} tasks/s, "
+                         f"{result['failures']} failed, median time to "
+                         f"complete {median} ms")
+            runs.append(dict(notify_count=notify_count, **result))
+    finally:
+        backend.restore()
+
+    report = {
+        "backend": backend.name,
+        "cmd": args.cmd,
+        "tasks": args.tasks,
+        "concurrency": args.concurrency,
+        "runs": runs,
+    }
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Reading and atomically writing the JSON files the caches, indexes and build
+stamps are kept in.
+
+Writes go to a uniquely named temporary file next to the target, which then
+replaces it. Readers never see a partially written file, and concurrent runs
+saving the same cache (e.g. formatter hooks of several editors) do not
+replace each other's temporary files; the last one to finish wins.
+"""
+import json
+import os
+import tempfile
+
+# Temporary files are created with mode 0600, give the written file the
+# mode a plain open() would.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def load_json(path, default=None):
+    """
+    :return: the data in the JSON file `path`, or `default` if the file is
+        missing or not valid JSON
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path, data):
+    """
+    Write `data` as JSON to `path`, creating its directory if needed.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w",
+                                     dir=directory,
+                                     prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp",
+                                     delete=False) as f:
+        try:
+            # json.dumps uses the C encoder, json.dump to a file does not.
+            f.write(json.dumps(data))
+            os.fchmod(f.fileno(), 0o666 & ~_UMASK)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
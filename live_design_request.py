@@ -1,6 +1,26 @@
+"""
+Build and decode the `maestro://` requests LiveDesign sends to Maestro.
+
+A request is a JSON object, percent-encoded after the `maestro://` scheme.
+Besides the single request demo (run without arguments), requests can be
+generated in bulk from CSV or JSON input to load-test Maestro's URL handler:
+
+    python live_design_request.py generate requests.csv --format cmd
+    python live_design_request.py decode uris.txt
+    python live_design_request.py benchmark --requests 10000
+
+Requests whose `row_keys` would make the URI longer than `--max-length` are
+split into several requests over chunks of the row keys.
+"""
+import csv
 import json
-import urllib
 import os
+import shlex
+import sys
+import time
+import urllib.parse
+from argparse import ArgumentParser
+
 #project = https://qa-demo-24-1.dev.bb.schrodinger.com/livedesign/#/projects/1351/livereports/125310
 url = "https://qa-demo-24-1.dev.bb.schrodinger.com/"
 # live_report_id = "125310"
@@ -14,6 +34,240 @@ column_ids = [
 row_keys = ["CMPD-10460"]
 report_level = "parent"
 
+SCHEME = "maestro://"
+# Conservative limit that URL handlers and command lines on all platforms
+# accept.
+DEFAULT_MAX_LENGTH = 2000
+# Fields every request of an action needs
+REQUIRED_FIELDS = {
+    "import_structure":
+    ("url", "live_report_id", "column_ids", "row_keys", "report_level"),
+    "import_attachment": ("url", "attachment_ids", "session_id"),
+}
+LIST_FIELDS = ("column_ids", "row_keys", "attachment_ids")
+# Separator of list values in CSV input
+CSV_LIST_SEPARATOR = ";"
+SEPARATORS = (",", ":")
+
+# Percent-encodes every ASCII character but the unreserved ones, like
+# urllib.parse.quote(safe=""), in a single C-level str.translate call.
+_QUOTE_TABLE = {
+    code: f"%{code:02X}"
+    for code in range(128)
+    if not (chr(code).isascii() and chr(code).isalnum() or chr(code) in "_.-~")
+}
+
+
+def _quote(text):
+    if text.isascii():
+        return text.translate(_QUOTE_TABLE)
+    return urllib.parse.quote(text, safe="")
+
+
+def encode_request(request):
+    return SCHEME + _quote(json.dumps(request, separators=SEPARATORS))
+
+
+def get_action(request):
+    # Requests of the attachment page do not name their action.
+    if "action" in request:
+        return request["action"]
+    return "import_attachment" if "attachment_ids" in request else (
+        "import_structure")
+
+
+def validate_request(request):
+    """
+    :raise ValueError: if required fields are missing or have the wrong
+        type
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request is not a JSON object")
+    action = get_action(request)
+    if action not in REQUIRED_FIELDS:
+        raise ValueError(f"Unknown action {action!r}")
+    problems = [
+        f"missing {field}" for field in REQUIRED_FIELDS[action]
+        if field not in request
+    ]
+    problems += [
+        f"{field} is not a list of strings" for field in LIST_FIELDS
+        if field in request and not (isinstance(request[field], list) and all(
+            isinstance(value, str) for value in request[field]))
+    ]
+    if problems:
+        raise ValueError(", ".join(problems))
+
+
+def decode_request(uri):
+    """
+    Inverse of `encode_request`.
+
+    :return: the validated request
+    :raise ValueError: if the URI is not a valid request
+    """
+    uri = uri.strip()
+    if not uri.startswith(SCHEME):
+        raise ValueError(f"URI does not start with {SCHEME}")
+    request = json.loads(urllib.parse.unquote(uri[len(SCHEME):]))
+    validate_request(request)
+    return request
+
+
+def decode_requests(uris):
+    """
+    Decode and validate URIs in bulk.
+
+    :return: (list of the valid requests, list of (line number, error) of
+        the invalid ones)
+    """
+    requests = []
+    errors = []
+    for line_number, uri in enumerate(uris, 1):
+        if not uri.strip():
+            continue
+        try:
+            requests.append(decode_request(uri))
+        except ValueError as err:
+            errors.append((line_number, str(err)))
+    return requests, errors
+
+
+def encode_chunked(request, max_length=DEFAULT_MAX_LENGTH):
+    """
+    Encode `request`, split into several URIs over chunks of its row keys so
+    that no URI is longer than `max_length`.
+
+    All fields but the row keys are the same in every chunk, so they are
+    serialized and quoted only once.
+
+    :return: generator of URIs
+    :raise ValueError: if a single row key does not fit in `max_length`
+    """
+    keys = request.get("row_keys")
+    if not keys:
+        yield encode_request(request)
+        return
+
+    # With row_keys as the last field, its empty list is the "[]" right
+    # before the closing brace.
+    base = {
+        field: value
+        for field, value in request.items() if field != "row_keys"
+    }
+    base["row_keys"] = []
+    base_json = json.dumps(base, separators=SEPARATORS)
+    prefix = SCHEME + _quote(base_json[:-2])
+    suffix = _quote(base_json[-2:])
+    separator = _quote(",")
+    budget = max_length - len(prefix) - len(suffix)
+
+    # Serialize and quote all keys in one go; JSON escapes newlines inside
+    # strings, so the quoted newlines only separate the keys.
+    quoted_keys = _quote(json.dumps(keys, separators=("\n", ":"))[1:-1])
+    chunk = []
+    length = 0
+    for key, quoted in zip(keys, quoted_keys.split(_quote("\n"))):
+        added = len(quoted) + (len(separator) if chunk else 0)
+        if chunk and length + added > budget:
+            yield prefix + separator.join(chunk) + suffix
+            chunk = []
+            length = 0
+            added = len(quoted)
+        if added > budget:
+            raise ValueError(f"Row key {key!r} does not fit in a "
+                             f"{max_length} character URI")
+        chunk.append(quoted)
+        length += added
+    yield prefix + separator.join(chunk) + suffix
+
+
+def read_requests(path):
+    """
+    Read request specifications from a CSV file with one column per field
+    (list fields separated by ";"), a JSON list of objects or a JSON lines
+    file.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {
+                    field: (value.split(CSV_LIST_SEPARATOR)
+                            if field in LIST_FIELDS else value)
+                    for field, value in row.items() if value
+                }
+            return
+        text = f.read()
+    if text.lstrip().startswith("["):
+        yield from json.loads(text)
+    else:
+        yield from (json.loads(line) for line in text.splitlines() if line)
+
+
+def get_command_line(uri):
+    schrodinger = os.getenv("SCHRODINGER")
+    return shlex.join([f"{schrodinger}/maestro", "-console", "-o", uri])
+
+
+def generate(input_file,
+             output,
+             output_format="uri",
+             max_length=DEFAULT_MAX_LENGTH):
+    """
+    Write one encoded URI or Maestro command line per line to `output`.
+
+    :return: number of requests written
+    """
+    count = 0
+    for request in read_requests(input_file):
+        validate_request(request)
+        for uri in encode_chunked(request, max_length):
+            output.write(
+                (get_command_line(uri) if output_format == "cmd" else uri) +
+                "\n")
+            count += 1
+    return count
+
+
+def benchmark(count, row_key_count, max_length=DEFAULT_MAX_LENGTH):
+    """
+    Print the encode and decode throughput for `count` requests of
+    `row_key_count` row keys each.
+    """
+    requests = [{
+        "action": "import_structure",
+        "url": url,
+        "live_report_id": str(i),
+        "report_level": report_level,
+        "column_ids": column_ids,
+        "user": "testadmin",
+        "row_keys": [f"CMPD-{i}-{j}" for j in range(row_key_count)],
+    } for i in range(count)]
+
+    start = time.perf_counter()
+    uris = [
+        uri for request in requests
+        for uri in encode_chunked(request, max_length)
+    ]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded, errors = decode_requests(uris)
+    decode_time = time.perf_counter() - start
+    if errors or len(decoded) != len(uris):
+        for line_number, error in errors:
+            print(f"URI {line_number}: {error}", file=sys.stderr)
+        sys.exit(f"{len(uris) - len(decoded)} of {len(uris)} encoded URIs "
+                 "did not decode to a valid request")
+
+    size_mb = sum(len(uri) for uri in uris) / 1e6
+    print(f"Encoded {count} requests into {len(uris)} URIs ({size_mb:.1f} "
+          f"MB) in {encode_time:.3f} s: {len(uris) / encode_time:.0f} "
+          f"URIs/s, {size_mb / encode_time:.1f} MB/s")
+    print(f"Decoded and validated {len(uris)} URIs in {decode_time:.3f} s: "
+          f"{len(uris) / decode_time:.0f} URIs/s, "
+          f"{size_mb / decode_time:.1f} MB/s")
+
 
 def print_json():
     json_dict = {}
@@ -27,11 +281,7 @@ def print_json():
     json_object = json.dumps(json_dict)
     print(json_object)
     print("\n")
-    uri_encoded = urllib.parse.quote(json_object)
-    final_request = f"maestro://{uri_encoded}"
-    SCHRODINGER = os.getenv("SCHRODINGER")
-    CMDS = [f"{SCHRODINGER}/maestro", "-console", "-o", final_request]
-    print(" ".join(CMDS))
+    print(get_command_line(encode_request(json_dict)))
 
 
 def get_request():
@@ -41,28 +291,72 @@ def get_request():
     json_object["url"] = url
     json_object["report_level"] = "parent"
     print(json_object)
-    json_string = json.dumps(json_object)
-    uri_encoded = urllib.parse.quote(json_string)
-    final_request = f"maestro://{uri_encoded}"
-    SCHRODINGER = os.getenv("SCHRODINGER")
-    CMDS = [f"{SCHRODINGER}/maestro", "-console", "-o", final_request]
-    print(" ".join(CMDS))
+    print(get_command_line(encode_request(json_object)))
 
 
 def get_arguments():
     json_request = "%7B%22action%22%3A%22import_structure%22%2C%22url%22%3A%22https%3A%2F%2Fqa-demo-24-2.dev.bb.schrodinger.com%2F%22%2C%22live_report_id%22%3A%22102962%22%2C%22report_level%22%3A%22pose%22%2C%22column_ids%22%3A%5B%2218592%22%5D%2C%22row_keys%22%3A%5B%22V51973-87493084%22%5D%2C%22user%22%3A%22testuser1%22%7D"
-    url_decode = urllib.parse.unquote(json_request)
-    print(url_decode)
-    #json_object = json.loads(url_decode)
-    #print(json_object)
+    print(decode_request(SCHEME + json_request))
 
 
-if __name__ == '__main__':
+def parse_args():
+    parser = ArgumentParser(
+        description="Build and decode LiveDesign requests to Maestro, run "
+        "without arguments for the single request demo")
+    subparsers = parser.add_subparsers(dest="command")
+    generate_parser = subparsers.add_parser(
+        "generate", help="Encode the requests of a CSV or JSON file")
+    generate_parser.add_argument("input", help="CSV, JSON or JSON lines file")
+    generate_parser.add_argument("--format",
+                                 choices=("uri", "cmd"),
+                                 default="uri",
+                                 help="Write URIs or Maestro command lines "
+                                 "(default: uri)")
+    generate_parser.add_argument("--output",
+                                 help="Output file (default: stdout)")
+    decode_parser = subparsers.add_parser(
+        "decode", help="Decode and validate one URI per line")
+    decode_parser.add_argument("input",
+                               nargs="?",
+                               help="File of URIs (default: stdin)")
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Measure the encode and decode throughput")
+    benchmark_parser.add_argument("--requests", type=int, default=10000)
+    benchmark_parser.add_argument("--row-keys", type=int, default=100)
+    for subparser in (generate_parser, benchmark_parser):
+        subparser.add_argument("--max-length",
+                               type=int,
+                               default=DEFAULT_MAX_LENGTH,
+                               help="Maximum URI length, longer requests "
+                               "are split over their row keys (default: "
+                               f"{DEFAULT_MAX_LENGTH})")
+    return parser.parse_args()
 
-    print_json()
 
-    print("\n\n\n")
-    get_request()
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == "generate":
+        output = open(args.output, "w") if args.output else sys.stdout
+        try:
+            count = generate(args.input, output, args.format, args.max_length)
+        finally:
+            if args.output:
+                output.close()
+        print(f"Generated {count} requests", file=sys.stderr)
+    elif args.command == "decode":
+        with open(args.input) if args.input else sys.stdin as f:
+            requests, errors = decode_requests(f)
+        for line_number, error in errors:
+            print(f"Line {line_number}: {error}", file=sys.stderr)
+        print(f"{len(requests)} valid, {len(errors)} invalid requests")
+        sys.exit(1 if errors else 0)
+    elif args.command == "benchmark":
+        benchmark(args.requests, args.row_keys, args.max_length)
+    else:
+        print_json()
+
+        print("\n\n\n")
+        get_request()
 
-    print("\n\n\n")
-    get_arguments()
+        print("\n\n\n")
+        get_arguments()
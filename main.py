@@ -1,177 +1,14 @@
+import atexit
 import os
-import subprocess
 from argparse import ArgumentParser
 import logging
-import contextlib
-import glob
-
-SCHRODINGER = os.getenv("SCHRODINGER")
-SCHRODINGER_SRC = os.getenv("SCHRODINGER_SRC")
-MAESTRO_SRC = "mmshare/maestro"
-MMSHARE = "mmshare"
-REPOS = [MMSHARE, MAESTRO_SRC]
-BUILD_TYPE = os.getenv("BUILD_TYPE")
-
-CLANG_CMD = ["clang-format", "--style=file", "-i"]
-YAPF_CMD = ["yapf", "-i"]
-FLAKE_CMD = ["flake8"]
-WAF_CMD = f"waf configure build install --build={BUILD_TYPE}"
-
-MMSHARE_SRC_PATH = os.path.join(SCHRODINGER_SRC, MMSHARE)
-MAESTRO_SRC_PATH = os.path.join(SCHRODINGER_SRC, MAESTRO_SRC)
-GIT_PULL_CMD = "git pull --rebase --autostash"
-SCRIPT_DIR = os.path.dirname(__file__)
-PYTEST_CMD = os.path.join(SCHRODINGER, "utilities", "py.test")
-SCHRODINGER_RUN_CMD = os.path.join(SCHRODINGER, "run")
-
-
-def run_cmd(cmd, cwd=os.getcwd()):
-    try:
-        logging.info(f"Command: {cmd} , inside directory: {cwd}")
-        output = subprocess.run(cmd, cwd=cwd, capture_output=True)
-        if stderr := output.stderr:
-            print("--------------------")
-            logging.error(str(stderr))
-            print("--------------------")
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Command {cmd} failed with error {e}")
-
-
-class EnvironmentVerifier:
-
-    def __init__(self):
-        self._mandatory_env_vars = [
-            "SCHRODINGER", "SCHRODINGER_SRC", "BUILD_TYPE", "SCHRODINGER_LIB"
-        ]
-
-    def verify(self, print_values=False):
-        missing_mandatory_env_vars = [
-            env for env in self._mandatory_env_vars if env not in os.environ
-        ]
-        for env in self._mandatory_env_vars:
-            if env in os.environ and print_values:
-                print(f"{env} = {os.environ[env]}")
-        if len(missing_mandatory_env_vars):
-            raise ValueError(
-                f"Environment variables {missing_mandatory_env_vars} is not set"
-            )
-
-
-class CodeFormatter:
-
-    def formatFiles(self, repo=MMSHARE, diff_generator="HEAD"):
-        modified_files = self._getModifiedFiles(repo, diff_generator)
-
-        yapf_supported_files = [
-            file for file in modified_files
-            if self._isYapfSupported(file) and os.path.isfile(file)
-        ]
-        clang_supported_files = [
-            file for file in modified_files
-            if self._isClangSupported(file) and os.path.isfile(file)
-        ]
-        self._formatPythonFiles(yapf_supported_files)
-        self._formatCppFiles(clang_supported_files)
-
-    def _formatPythonFiles(self, files):
-
-        if files:
-            run_cmd(YAPF_CMD + files)
-            run_cmd(FLAKE_CMD + files)
-        else:
-            logging.info("No python files to format")
-
-    def _formatCppFiles(self, files):
-        if files:
-            run_cmd(CLANG_CMD + files)
-        else:
-            logging.info("No cpp files to format")
-
-    def _getModifiedFiles(self, repo, diff_generator):
-        if not _is_valid_repo(repo):
-            raise ValueError(f"Invalid repo: {repo}")
-
-        with cd_dir(_get_repo_path(repo)):
-            git_command = f"git diff --name-only {diff_generator}"
-            output = subprocess.check_output(git_command.split())
-            return output.decode("utf-8").strip().split("\n")
-
-    def _isClangSupported(self, file):
-        cpp_extensions = [".cpp", ".h", ".cxx", ".c", ".hpp"]
-        return any(file.endswith(extension) for extension in cpp_extensions)
-
-    def _isYapfSupported(self, file):
-        return file.endswith(".py") or file.endswith("wscript")
-
-
-class Builder:
-
-    def buildMaestroWithoutTests(self):
-        cmd = WAF_CMD + ' --target=maestro'
-        run_cmd(cmd, cwd=MAESTRO_SRC_PATH)
-
-    def buildMMSharePython(self):
-        mmshare_build_dir = self._get_mmshare_build_dir()
-        make_py = ["make", "python"]
-        run_cmd(make_py, cwd=mmshare_build_dir)
-        logger.info("Done!")
-
-    def buildMMShareWithoutMakeSteps(self):
-        cmd = WAF_CMD + ' --skipmakesteps'
-        run_cmd(cmd, cwd=MMSHARE_SRC_PATH)
-
-    def _get_mmshare_build_dir(self):
-        return glob.glob(os.path.join(SCHRODINGER, "mmshare-v*"))[0]
 
+from environment import MANDATORY_ENV_VARS, EnvironmentVerifier
 
-class Tester:
-
-    def run_tests(self, test_path, count):
-        count = int(count)
-        if count < 1:
-            raise ValueError("Count should be greater than 0")
-
-        output_file = os.path.join(SCHRODINGER, "test_output.log")
-        if os.path.exists(output_file):
-            os.remove(output_file)
-
-        logging.info(f"Running tests in parallel {test_path} , {count} times")
-
-        if os.path.exists(test_path):
-            #test_run_cmd = [PYTEST_CMD, "-n", "auto", test_path]
-            test_run_cmd = [SCHRODINGER_RUN_CMD, test_path]
-            logging.info(f"Writing results to {output_file}")
-
-            with open(output_file, "w") as f:
-                f.write(f"Running {test_path} for {count} times")
-
-                for i in range(count):
-                    if subprocess.call(test_run_cmd, stdout=f, stderr=f) != 0:
-                        logging.error(
-                            f"Test failed in {i}th run, stopping further test execution"
-                        )
-                        return
-
-            logging.info("Test ran successfully every time")
-
-
-def _get_repo_path(repo):
-    return os.path.join(SCHRODINGER_SRC, repo)
-
-
-def _is_valid_repo(repo):
-    full_path = _get_repo_path(repo)
-    return os.path.isdir(full_path) and repo in REPOS
-
-
-@contextlib.contextmanager
-def cd_dir(new_dir):
-    old_dir = os.getcwd()
-    os.chdir(new_dir)
-    try:
-        yield
-    finally:
-        os.chdir(old_dir)
+BUILD_OPTIONS = ("build_mmshare_without_make", "build_mmshare_python",
+                 "build_maestro_only")
+GIT_PULL_CMD = "git pull --rebase --autostash"
+SCRIPT_DIR = os.path.dirname(__file__)
 
 
 def parse_args():
@@ -187,7 +24,8 @@ def parse_args():
                         action="store_true")
 
     parser.add_argument("--format",
-                        help="Format the modified files",
+                        help="Format the modified, staged and untracked files "
+                        "of every repo in REPOS and $BUILD_HACK_EXTRA_REPOS",
                         nargs=1,
                         metavar=("diff_generator"))
 
@@ -204,39 +42,103 @@ def parse_args():
                         help="Build mmshare without make steps",
                         action="store_true")
 
+    parser.add_argument("--dry-run",
+                        help="Print the planned graph of the selected build "
+                        "steps without running them",
+                        action="store_true")
+
+    parser.add_argument("--force",
+                        help="Run the selected build steps even if nothing "
+                        "changed since their last successful build",
+                        action="store_true")
+
+    parser.add_argument("--timeout",
+                        help="Kill build commands that run longer than this "
+                        "many seconds",
+                        type=float)
+
     parser.add_argument("--run-tests",
                         help="Run tests X number of times",
                         nargs=2,
                         metavar=("test_path", "count"))
 
+    parser.add_argument("--affected-by",
+                        help="Only run the --run-tests tests affected by the "
+                        "files modified relative to diff_generator, split "
+                        "into --jobs shards of about equal duration",
+                        metavar="diff_generator")
+
+    parser.add_argument("--jobs",
+                        help="Number of concurrent workers used by --format, "
+                        "the build steps and --run-tests (default: number of "
+                        "cores)",
+                        type=int)
+
+    parser.add_argument("--trace",
+                        help="Time the phases of the commands, write them as "
+                        "a Chrome trace-event JSON to FILE and print a "
+                        "summary",
+                        metavar="FILE")
+
+    parser.add_argument("--keep-going",
+                        help="Keep running the remaining --run-tests repeats "
+                        "after a failure and report a pass/fail tally",
+                        action="store_true")
+
     return parser.parse_args()
 
 
+def _verify_env(env_vars):
+    EnvironmentVerifier(env_vars).verify()
+
+
 def __main__():
     args = parse_args()
 
-    env_verifier = EnvironmentVerifier()
-    env_verifier.verify(print_values=bool(args.verify_env))
+    # Subcommand modules are only imported when their command is requested,
+    # keeping startup cheap for editor and git hooks.
+    if args.trace:
+        import telemetry
+        telemetry.enable()
+        atexit.register(telemetry.write_report, args.trace)
+
+    if args.verify_env:
+        EnvironmentVerifier().verify(print_values=True)
 
     if args.format:
+        _verify_env(["SCHRODINGER_SRC"])
+        from formatter import CodeFormatter
         code_formatter = CodeFormatter()
-        code_formatter.formatFiles(diff_generator=args.format[0])
-
-    if args.build_maestro_only:
-        builder = Builder()
-        builder.buildMaestroWithoutTests()
-
-    if args.build_mmshare_python:
-        builder = Builder()
-        builder.buildMMSharePython()
-
-    if args.build_mmshare_without_make:
-        builder = Builder()
-        builder.buildMMShareWithoutMakeSteps()
+        code_formatter.formatFiles(diff_generator=args.format[0],
+                                   jobs=args.jobs)
+
+    if any(getattr(args, option) for option in BUILD_OPTIONS):
+        _verify_env(MANDATORY_ENV_VARS)
+        from build_graph import BuildGraph
+        from builder import Builder
+        builder = Builder(timeout=args.timeout, force=args.force)
+        build_steps = [
+            step for option, step in builder.getSteps().items()
+            if getattr(args, option)
+        ]
+        build_graph = BuildGraph(build_steps)
+        if args.dry_run:
+            print(build_graph.describe())
+        else:
+            build_graph.run(jobs=args.jobs)
 
     if args.run_tests:
+        env_vars = ["SCHRODINGER"]
+        if args.affected_by:
+            env_vars.append("SCHRODINGER_SRC")
+        _verify_env(env_vars)
+        from tester import Tester
         tester = Tester()
-        tester.run_tests(args.run_tests[0], args.run_tests[1])
+        tester.run_tests(args.run_tests[0],
+                         args.run_tests[1],
+                         jobs=args.jobs,
+                         keep_going=args.keep_going,
+                         affected_by=args.affected_by)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+"""
+Cached index of the performance test input corpus.
+
+For every input file the index records its size, uncompressed size,
+number of entries (structures) and content hash. Entries are counted by
+scanning for the record markers of `.mae`, `.sdf` and `.pdb` files, through
+gzip for compressed ones; projects only get their sizes. Files whose size
+and mtime did not change since they were indexed are not read again.
+"""
+import collections
+import gzip
+import logging
+import os
+import struct
+import zipfile
+
+from format_cache import hash_file
+from json_cache import load_json, write_json_atomic
+
+INDEX_VERSION = 1
+FILE_SUPPORTED_EXTENSIONS = (".mae", ".maegz", ".mae.gz", ".sd", ".sdf",
+                             ".pdb")
+PROJECT_SUPPORTED_EXTENSION = (".prj", ".prjzip", ".prj.zip")
+GZIP_EXTENSIONS = (".maegz", ".gz")
+ZIP_EXTENSIONS = (".prjzip", ".zip")
+# Each entry starts with a line starting with the marker; a PDB file
+# without MODEL records holds a single entry.
+ENTRY_MARKERS = {
+    ".mae": b"f_m_ct",
+    ".maegz": b"f_m_ct",
+    ".sd": b"$$$$",
+    ".sdf": b"$$$$",
+    ".pdb": b"MODEL ",
+}
+CHUNK_SIZE = 1 << 20
+# Upper bounds of the uncompressed size of the size classes
+SIZE_CLASSES = (("small", 1 << 20), ("medium", 50 << 20), ("large", None))
+
+CorpusEntry = collections.namedtuple(
+    "CorpusEntry",
+    ["path", "size", "mtime_ns", "uncompressed_size", "entry_count", "hash"])
+
+
+def is_input_file(name):
+    return name.endswith(FILE_SUPPORTED_EXTENSIONS) or name.endswith(
+        PROJECT_SUPPORTED_EXTENSION)
+
+
+def find_input_files(directory, recursive=False):
+    """
+    :param recursive: whether to search the subdirectories as well;
+        project directories are inputs and are not descended into
+    :return: sorted paths of the input files
+    """
+    input_files = []
+    for root, dirs, files in os.walk(directory):
+        input_files += [
+            os.path.join(root, name) for name in files + dirs
+            if is_input_file(name)
+        ]
+        dirs[:] = [
+            name for name in dirs if recursive and not is_input_file(name)
+        ]
+    return sorted(input_files)
+
+
+def get_size_class(uncompressed_size):
+    for name, limit in SIZE_CLASSES:
+        if limit is None or uncompressed_size < limit:
+            return name
+
+
+def _get_extension(path):
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-len(".gz")] + "gz"
+    return os.path.splitext(name)[1]
+
+
+def _count_markers(f, marker):
+    """
+    Count the lines of `f` starting with `marker`, reading in chunks.
+    """
+    pattern = b"\n" + marker
+    first = f.read(CHUNK_SIZE)
+    count = int(first.startswith(marker)) + first.count(pattern)
+    # Keep a tail shorter than the pattern, so no match is counted twice.
+    tail = first[-(len(pattern) - 1):]
+    while chunk := f.read(CHUNK_SIZE):
+        data = tail + chunk
+        count += data.count(pattern)
+        tail = data[-(len(pattern) - 1):]
+    return count
+
+
+def _get_directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path) for name in files)
+
+
+def _index_file(path, stat):
+    if os.path.isdir(path):
+        size = _get_directory_size(path)
+        return CorpusEntry(path, size, stat.st_mtime_ns, size, None, None)
+
+    extension = _get_extension(path)
+    compressed = path.lower().endswith(GZIP_EXTENSIONS)
+    uncompressed_size = stat.st_size
+    if compressed:
+        # The gzip trailer holds the uncompressed size modulo 2**32.
+        with open(path, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            uncompressed_size = struct.unpack("<I", f.read(4))[0]
+    elif path.lower().endswith(ZIP_EXTENSIONS):
+        with zipfile.ZipFile(path) as archive:
+            uncompressed_size = sum(info.file_size
+                                    for info in archive.infolist())
+
+    entry_count = None
+    marker = ENTRY_MARKERS.get(extension)
+    if marker:
+        with (gzip.open(path, "rb") if compressed else open(path, "rb")) as f:
+            entry_count = _count_markers(f, marker)
+        if extension == ".pdb":
+            entry_count = max(entry_count, 1)
+    return CorpusEntry(path, stat.st_size, stat.st_mtime_ns, uncompressed_size,
+                       entry_count, hash_file(path))
+
+
+class CorpusIndex:
+
+    def __init__(self, index_file):
+        self._index_file = index_file
+        self._entries = self._load()
+        self._dirty = False
+
+    def index(self, paths):
+        """
+        :return: CorpusEntry of every path, read from the index for files
+            that did not change since they were indexed
+        """
+        entries = {}
+        indexed = 0
+        for path in paths:
+            stat = os.stat(path)
+            entry = self._entries.get(path)
+            if entry is None or (entry.size, entry.mtime_ns) != (
+                    stat.st_size, stat.st_mtime_ns) or os.path.isdir(path):
+                try:
+                    entry = _index_file(path, stat)
+                except (OSError, EOFError, zipfile.BadZipFile,
+                        struct.error) as err:
+                    logging.warning(f"Could not index {path}: {err}")
+                    entry = CorpusEntry(path, stat.st_size, stat.st_mtime_ns,
+                                        stat.st_size, None, None)
+                indexed += 1
+            entries[path] = entry
+        logging.info(f"Indexed {indexed} new or changed input files, reused "
+                     f"{len(paths) - indexed} from {self._index_file}")
+        if indexed or entries.keys() != self._entries.keys():
+            self._entries = entries
+            self._dirty = True
+        return [entries[path] for path in paths]
+
+    def save(self):
+        if not self._dirty:
+            return
+        write_json_atomic(
+            self._index_file, {
+                "version": INDEX_VERSION,
+                "entries": [list(entry) for entry in self._entries.values()]
+            })
+        self._dirty = False
+
+    def _load(self):
+        data = load_json(self._index_file, {})
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return {
+            entry[0]: CorpusEntry(*entry)
+            for entry in data.get("entries", [])
+        }
@@ -0,0 +1,384 @@
+"""
+Streaming parsers for the Maestro command and graphics timing logs.
+
+Each command log starts with the quoted name of the input file, followed by
+one `<function> = <N> ms` entry per line. Command logs are memory-mapped and
+scanned in bulk with a compiled regex instead of being read line by line.
+Graphics logs hold one quoted `<activity>\t<seconds>` entry per line after
+their "Timing" and "Period" headers.
+
+The parsed timings are collected into one array-backed column per function
+or activity, which can be written as CSV or as a NumPy `.npz` archive of
+typed columns.
+"""
+import array
+import collections
+import concurrent.futures
+import csv
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import zipfile
+
+from stats import summarize
+
+CHUNK_SIZE = 8 * 1024 * 1024
+# Matches every non-blank line: timing entries fill both groups, any other
+# line only matches its first non-blank character and leaves them empty.
+TIMING_LINE_RE = re.compile(
+    rb"^[ \t]*(?:([^=\r\n]*?)[ \t]*=[ \t]*([+-]?\d+)[ \t]*ms[ \t]*\r?$|\S)",
+    re.M)
+# Logs of repeated benchmark runs are named <input file>.rep<N>.log
+REPEAT_LOG_RE = re.compile(r"\.rep(\d+)(\.log)$")
+GRAPHICS_HEADER_PREFIXES = ("Timing", "Period")
+
+ParsedLog = collections.namedtuple(
+    "ParsedLog",
+    ["path", "file_name", "repeat", "timings", "entries", "malformed"])
+
+
+def get_repeat_log_name(log_name, repeat):
+    """
+    Return the name of the log of the given repeat of a benchmark run, e.g.
+    "a.mae.log" -> "a.mae.rep2.log".
+    """
+    return f"{log_name[:-len('.log')]}.rep{repeat}.log"
+
+
+def split_repeat(log_name):
+    """
+    Inverse of `get_repeat_log_name`: return the log name without its repeat
+    index, and the repeat index (0 for logs of unrepeated runs).
+    """
+    match = REPEAT_LOG_RE.search(log_name)
+    if match is None:
+        return log_name, 0
+    return log_name[:match.start()] + match.group(2), int(match.group(1))
+
+
+def write_summary_csv(samples, output_csv, name_header):
+    """
+    Write min/median/p95/stddev of every set of repeated timings.
+
+    :param samples: dict mapping (input file, timing name) to the values
+        measured in each repeat
+    """
+    with open(output_csv, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow([
+            'Filename', name_header, 'Count', 'Min', 'Median', 'P95', 'Stddev'
+        ])
+        for (file_name, name), values in sorted(samples.items()):
+            summary = summarize(values)
+            writer.writerow([file_name, name, summary.count] + [
+                round(value, 3) for value in (summary.min, summary.median,
+                                              summary.p95, summary.stddev)
+            ])
+
+
+def read_timing_log_file_name(path):
+    """
+    :return: the input file name in the header of a command timing log, or
+        None if the log is empty
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+    if not header:
+        return None
+    return header.decode("utf-8", errors="replace").strip().strip('"')
+
+
+def parse_timing_log(path):
+    """
+    Parse a single timing log, summing the times of repeated functions.
+
+    :return: ParsedLog, or None if the log is empty
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end = data.find(b"\n")
+            if header_end == -1:
+                header_end = len(data)
+            file_name = data[:header_end].decode(
+                "utf-8", errors="replace").strip().strip('"')
+
+            timings = {}
+            entries = malformed = 0
+            # Scan in newline-aligned chunks so each findall call stays
+            # bounded however large the log is.
+            start = header_end
+            while start < len(data):
+                end = data.find(b"\n", start + CHUNK_SIZE)
+                if end == -1:
+                    end = len(data)
+                for name, value in TIMING_LINE_RE.findall(data, start, end):
+                    if value:
+                        timings[name] = timings.get(name, 0) + int(value)
+                        entries += 1
+                    else:
+                        malformed += 1
+                start = end
+
+    timings = {
+        name.decode("utf-8", errors="replace"): value
+        for name, value in timings.items()
+    }
+    _, repeat = split_repeat(os.path.basename(path))
+    return ParsedLog(path, file_name, repeat, timings, entries, malformed)
+
+
+def parse_graphics_line(line):
+    """
+    :return: (activity, seconds) of a graphics log line, or None for blank
+        and header lines
+    :raise ValueError: if the line is malformed
+    """
+    line = line.replace('"', '').strip()
+    if not line or line.startswith(GRAPHICS_HEADER_PREFIXES):
+        return None
+    parts = line.split("\t")
+    if len(parts) < 2:
+        raise ValueError(f"Malformed graphics timing: {line}")
+    return parts[0].strip(), float(parts[1])
+
+
+def parse_graphics_log(path, activities=None):
+    """
+    Parse a single graphics timing log, streaming it line by line.
+
+    :param activities: if given, only keep the times of these activities
+    :return: ParsedLog, keyed by the log name without its repeat index
+    """
+    timings = {}
+    entries = malformed = 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                entry = parse_graphics_line(line)
+            except ValueError:
+                malformed += 1
+                continue
+            if entry is None:
+                continue
+            activity, value = entry
+            entries += 1
+            if activities is None or activity in activities:
+                timings[activity] = value
+    log_name, repeat = split_repeat(os.path.basename(path))
+    return ParsedLog(path, log_name, repeat, timings, entries, malformed)
+
+
+def read_activity_schema(path):
+    """
+    Read the activities to report from a schema file listing one activity
+    per line. Blank lines and lines starting with "#" are ignored.
+    """
+    with open(path) as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+class TimingTable:
+    """
+    Timings per input file and repeat, stored as one float column per
+    function. Rows without a timing for a function hold NaN in its column.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.columns = {}
+        self._row_indices = {}
+
+    def add(self, file_name, timings, repeat=0):
+        key = (file_name, repeat)
+        row = self._row_indices.get(key)
+        if row is None:
+            row = self._row_indices[key] = len(self.rows)
+            self.rows.append(key)
+            for column in self.columns.values():
+                column.append(math.nan)
+
+        for function, value in timings.items():
+            column = self.columns.get(function)
+            if column is None:
+                column = self.columns[function] = array.array(
+                    "d", [math.nan]) * len(self.rows)
+            if math.isnan(column[row]):
+                column[row] = value
+            else:
+                column[row] += value
+
+    def iterTimings(self):
+        """
+        Yield (file name, repeat, function, value) for every recorded timing.
+        """
+        for function, column in self.columns.items():
+            for (file_name, repeat), value in zip(self.rows, column):
+                if not math.isnan(value):
+                    yield file_name, repeat, function, value
+
+    def getSamples(self):
+        """
+        :return: dict mapping (file name, function) to the values of all
+            repeats
+        """
+        samples = collections.defaultdict(list)
+        for file_name, _, function, value in self.iterTimings():
+            samples[(file_name, function)].append(value)
+        return samples
+
+    def getColumn(self, name, extra_columns=None):
+        """
+        :param extra_columns: dict mapping column names to dicts of values
+            keyed by (file name, repeat), for columns not stored in the table
+        :return: array of the values of a column, NaN where missing
+        """
+        if name in self.columns:
+            return self.columns[name]
+        values = (extra_columns or {}).get(name, {})
+        return array.array("d",
+                           (values.get(key, math.nan) for key in self.rows))
+
+    def writeCsv(self, output_csv, columns=None, extra_columns=None):
+        """
+        :param columns: names of the columns to write in order, by default
+            all columns of the table sorted by name
+        :param extra_columns: see `getColumn`, appended after `columns`
+        """
+        names = self._getColumnNames(columns, extra_columns)
+        values = [self.getColumn(name, extra_columns) for name in names]
+        # Only add a repeat column for repeated runs, keeping the layout of
+        # single runs unchanged.
+        repeated = any(repeat for _, repeat in self.rows)
+        with open(output_csv, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Filename'] + (['Repeat'] if repeated else []) +
+                            names)
+            for row, (file_name, repeat) in enumerate(self.rows):
+                writer.writerow(
+                    [file_name] + ([repeat] if repeated else []) +
+                    [_format_value(column[row]) for column in values])
+
+    def writeNpz(self, output_npz, columns=None, extra_columns=None):
+        """
+        Write the table as an uncompressed NumPy `.npz` archive, loadable
+        with `numpy.load`, holding a "Filename" string array, a "Repeat"
+        int64 array and one float64 array per column. NumPy is not needed
+        to write it.
+
+        :param columns: see `writeCsv`
+        :param extra_columns: see `getColumn`
+        """
+        names = self._getColumnNames(columns, extra_columns)
+        with zipfile.ZipFile(output_npz, "w") as archive:
+            archive.writestr("Filename.npy",
+                             _npy_strings([name for name, _ in self.rows]))
+            archive.writestr(
+                "Repeat.npy",
+                _npy_array(
+                    array.array("q", (repeat for _, repeat in self.rows)),
+                    "i8"))
+            for name in names:
+                archive.writestr(
+                    f"{name}.npy",
+                    _npy_array(self.getColumn(name, extra_columns), "f8"))
+
+    def _getColumnNames(self, columns, extra_columns):
+        names = sorted(self.columns) if columns is None else list(columns)
+        return names + [
+            name for name in extra_columns or {} if name not in names
+        ]
+
+
+def _npy(descr, shape, data):
+    header = repr({"descr": descr, "fortran_order": False, "shape": shape})
+    # The header is padded with spaces and a newline so that the data starts
+    # at a multiple of 64 bytes, as the format requires.
+    header = header.encode("latin1")
+    header += b" " * (-(10 + len(header) + 1) % 64) + b"\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H",
+                                              len(header)) + header + data
+
+
+def _npy_array(values, type_code):
+    """
+    :param values: array.array of 8 byte items
+    :param type_code: NumPy type of the items without byte order, e.g. "f8"
+    """
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return _npy("<" + type_code, (len(values), ), values.tobytes())
+
+
+def _npy_strings(values):
+    width = max((len(value) for value in values), default=1)
+    data = b"".join(
+        value.ljust(width, "\0").encode("utf-32-le") for value in values)
+    return _npy(f"<U{width}", (len(values), ), data)
+
+
+def _format_value(value):
+    if math.isnan(value):
+        return ""
+    return int(value) if value.is_integer() else value
+
+
+def iter_parsed_logs(paths, jobs=None, parser=parse_timing_log):
+    """
+    Parse the timing logs on a pool of `jobs` processes, yielding a
+    ParsedLog (or None for empty logs) per path in order.
+
+    :param parser: function parsing a single log into a ParsedLog, e.g.
+        `parse_timing_log` or `parse_graphics_log`; must be picklable
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) < 2:
+        yield from map(parser, paths)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            yield from pool.map(parser,
+                                paths,
+                                chunksize=max(1, len(paths) // 64))
+
+
+def parse_timing_logs(paths, jobs=None, parser=parse_timing_log):
+    """
+    Parse the timing logs on a pool of `jobs` processes, see
+    `iter_parsed_logs`.
+
+    Malformed lines and empty logs are skipped and counted rather than
+    aborting the whole run.
+
+    :return: (TimingTable, collections.Counter of parse statistics)
+    """
+    table = TimingTable()
+    counters = collections.Counter()
+    collect_parsed_logs(iter_parsed_logs(paths, jobs, parser), table,
+                        counters)
+    return table, counters
+
+
+def collect_parsed_logs(results, table, counters):
+    """
+    Add the ParsedLog results to `table`, counting them in `counters`.
+    """
+    for parsed in results:
+        if parsed is None:
+            counters["empty_files"] += 1
+            continue
+        table.add(parsed.file_name, parsed.timings, parsed.repeat)
+        counters["files"] += 1
+        counters["entries"] += parsed.entries
+        counters["malformed_lines"] += parsed.malformed
+        if parsed.malformed:
+            logging.debug(f"Skipped {parsed.malformed} malformed lines in "
+                          f"{parsed.path}")
@@ -0,0 +1,119 @@
+"""
+Manifest of parsed timing logs, used to re-aggregate a log directory
+incrementally.
+
+The manifest records the size, mtime and content hash of every log along
+with its parsed result. On the next aggregation only logs that are new or
+whose contents changed are parsed again; the results of all other logs are
+taken from the manifest. Logs whose size and mtime are unchanged are not
+even read. The whole manifest is dropped when the parser it was built with
+changes.
+"""
+import collections
+import logging
+import os
+
+from format_cache import hash_file
+from json_cache import load_json, write_json_atomic
+from perf_logs import (ParsedLog, TimingTable, collect_parsed_logs,
+                       iter_parsed_logs, parse_timing_log)
+
+MANIFEST_VERSION = 1
+
+
+class LogManifest:
+
+    def __init__(self, manifest_file, parser_key):
+        """
+        :param parser_key: identifies the parser and its settings; a manifest
+            written with a different key is discarded
+        """
+        self._manifest_file = manifest_file
+        self._parser_key = parser_key
+        self._entries = self._load()
+        self._dirty = False
+
+    def parse(self, paths, jobs=None, parser=parse_timing_log):
+        """
+        Parse the timing logs like `perf_logs.parse_timing_logs`, reusing the
+        results recorded for unchanged logs. Logs missing from `paths` are
+        dropped from the manifest.
+
+        :return: (TimingTable, collections.Counter of parse statistics)
+        """
+        entries = {}
+        results = {}
+        to_parse = []
+        for path in paths:
+            name = os.path.basename(path)
+            stat = os.stat(path)
+            entry = self._entries.get(name)
+            if entry is not None and not _is_unchanged(entry, stat):
+                # Rewritten or touched, only reparse if the contents changed.
+                content_hash = hash_file(path)
+                if entry["hash"] == content_hash:
+                    entry = dict(entry,
+                                 size=stat.st_size,
+                                 mtime_ns=stat.st_mtime_ns)
+                else:
+                    entry = None
+            if entry is None:
+                to_parse.append(path)
+            else:
+                entries[name] = entry
+                results[path] = _to_parsed_log(path, entry)
+
+        for path, parsed in zip(to_parse,
+                                iter_parsed_logs(to_parse, jobs, parser)):
+            stat = os.stat(path)
+            entries[os.path.basename(path)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": hash_file(path),
+                "result": parsed and parsed._replace(path=None)._asdict()
+            }
+            results[path] = parsed
+        logging.info(f"Parsed {len(to_parse)} new or changed timing logs, "
+                     f"reused {len(paths) - len(to_parse)} from "
+                     f"{self._manifest_file}")
+
+        if to_parse or entries != self._entries:
+            self._entries = entries
+            self._dirty = True
+        table = TimingTable()
+        counters = collections.Counter()
+        collect_parsed_logs((results[path] for path in paths), table, counters)
+        return table, counters
+
+    def save(self):
+        if not self._dirty:
+            return
+        write_json_atomic(
+            self._manifest_file, {
+                "version": MANIFEST_VERSION,
+                "parser": self._parser_key,
+                "entries": self._entries
+            })
+        self._dirty = False
+
+    def _load(self):
+        data = load_json(self._manifest_file)
+        if data is None:
+            return {}
+        if (data.get("version"), data.get("parser")) != (MANIFEST_VERSION,
+                                                         self._parser_key):
+            logging.info(f"Timing log parser changed, discarding "
+                         f"{self._manifest_file}")
+            return {}
+        return data.get("entries", {})
+
+
+def _is_unchanged(entry, stat):
+    return (entry["size"], entry["mtime_ns"]) == (stat.st_size,
+                                                  stat.st_mtime_ns)
+
+
+def _to_parsed_log(path, entry):
+    if entry["result"] is None:
+        return None
+    return ParsedLog(**dict(entry["result"], path=path))
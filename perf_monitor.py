@@ -0,0 +1,205 @@
+"""
+Live progress of a Maestro benchmark run.
+
+While Maestro runs, a background thread polls the output directory for
+timing logs and tails them, remembering how far each log has been read so
+only appended data is parsed. Progress (timing logs done, ETA and running
+medians of the slowest timings) is logged whenever a log completes.
+
+Maestro processes can be registered with the directory their logs go to;
+a process is killed when no timing log in its directory grows for longer
+than the per-file timeout, e.g. because an import hung.
+"""
+import logging
+import os
+import statistics
+import threading
+import time
+
+from cmd_runner import kill_process_group
+from perf_logs import TIMING_LINE_RE, parse_graphics_line
+from perf_scheduler import PERFORMANCE_LOGS_DIR_NAME
+
+DEFAULT_POLL_INTERVAL = 1.0
+# Number of timings whose running median is shown in the progress line
+SHOWN_MEDIANS = 3
+
+
+class _TailedLog:
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.timings = {}
+
+
+class LiveMonitor(threading.Thread):
+
+    def __init__(self,
+                 output_dir,
+                 expected_logs,
+                 file_timeout=None,
+                 interval=DEFAULT_POLL_INTERVAL):
+        """
+        :param expected_logs: number of graphics timing logs the run writes,
+            used for the ETA
+        :param file_timeout: seconds without timing log progress after which
+            a registered Maestro process is killed, None to never kill
+        """
+        super().__init__(daemon=True)
+        self._output_dir = output_dir
+        self._expected_logs = expected_logs
+        self._file_timeout = file_timeout
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._logs = {}
+        self._processes = {}
+        self._last_progress = {}
+        self._start = time.monotonic()
+        self._reported = 0
+        self.killed = []
+
+    def register(self, log_dir, proc):
+        """
+        Watch the Maestro process `proc` writing its timing logs to
+        `log_dir` for the per-file timeout.
+        """
+        with self._lock:
+            self._processes[log_dir] = proc
+            self._last_progress[log_dir] = time.monotonic()
+
+    def unregister(self, log_dir):
+        with self._lock:
+            self._processes.pop(log_dir, None)
+
+    def run(self):
+        while not self._stop_event.wait(self._interval):
+            self._poll()
+            self._checkTimeouts()
+            self._report()
+
+    def stop(self):
+        """
+        Stop monitoring and log the final progress.
+        """
+        self._stop_event.set()
+        self.join()
+        self._poll()
+        self._report(force=True)
+
+    def getMedians(self, kind):
+        """
+        :param kind: "graphics" or "command"
+        :return: dict mapping every timing name to its median over the logs
+            read so far
+        """
+        values = {}
+        for (log_kind, _), log in list(self._logs.items()):
+            if log_kind == kind:
+                for name, value in log.timings.items():
+                    values.setdefault(name, []).append(value)
+        return {
+            name: statistics.median(samples)
+            for name, samples in values.items()
+        }
+
+    def _poll(self):
+        for root, _, files in os.walk(self._output_dir):
+            kind = ("command" if os.path.basename(root)
+                    == PERFORMANCE_LOGS_DIR_NAME else "graphics")
+            for name in files:
+                if name.endswith(".log"):
+                    self._tail(kind, os.path.join(root, name))
+
+    def _tail(self, kind, path):
+        # Logs are keyed by name, so that logs moved when merging the shard
+        # directories are not read twice.
+        key = (kind, os.path.basename(path))
+        log = self._logs.get(key)
+        if log is None:
+            log = self._logs[key] = _TailedLog(path)
+        log.path = path
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < log.offset:
+                    # Rewritten from scratch
+                    log.offset = 0
+                    log.timings = {}
+                if size == log.offset:
+                    return
+                f.seek(log.offset)
+                data = f.read(size - log.offset)
+        except OSError:
+            return
+        # Only consume complete lines, the rest is read once it is finished.
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        log.offset += end
+        self._parse(kind, log, data[:end])
+        self._recordProgress(path)
+
+    def _parse(self, kind, log, data):
+        if kind == "command":
+            for name, value in TIMING_LINE_RE.findall(data):
+                if value:
+                    name = name.decode("utf-8", errors="replace")
+                    log.timings[name] = log.timings.get(name, 0) + int(value)
+            return
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                entry = parse_graphics_line(line)
+            except ValueError:
+                continue
+            if entry is not None:
+                log.timings[entry[0]] = entry[1]
+
+    def _recordProgress(self, path):
+        with self._lock:
+            for log_dir in self._last_progress:
+                if path.startswith(os.path.join(log_dir, "")):
+                    self._last_progress[log_dir] = time.monotonic()
+
+    def _checkTimeouts(self):
+        if not self._file_timeout:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for log_dir, proc in list(self._processes.items()):
+                idle = now - self._last_progress[log_dir]
+                if idle > self._file_timeout and proc.poll() is None:
+                    logging.error(f"No timing log progress in {log_dir} for "
+                                  f"{idle:.0f}s, killing Maestro "
+                                  f"(pid {proc.pid})")
+                    kill_process_group(proc.pid)
+                    self.killed.append(log_dir)
+                    del self._processes[log_dir]
+
+    def _report(self, force=False):
+        done = sum(1 for (kind, _), log in list(self._logs.items())
+                   if kind == "graphics" and log.timings)
+        if done == self._reported and not force:
+            return
+        self._reported = done
+        elapsed = time.monotonic() - self._start
+        eta = "unknown"
+        if done:
+            remaining = max(0, self._expected_logs - done)
+            eta = _format_seconds(elapsed / done * remaining)
+        message = (f"Progress: {done}/{self._expected_logs} timing logs, "
+                   f"{_format_seconds(elapsed)} elapsed, ETA {eta}")
+        for kind, unit in (("graphics", "s"), ("command", "ms")):
+            slowest = sorted(self.getMedians(kind).items(),
+                             key=lambda item: item[1],
+                             reverse=True)[:SHOWN_MEDIANS]
+            if slowest:
+                message += f"; median {kind}: " + ", ".join(
+                    f"{name} {value:g} {unit}" for name, value in slowest)
+        logging.info(message)
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
@@ -0,0 +1,238 @@
+"""
+Resource profiling sidecar for the Maestro benchmark runs.
+
+While Maestro runs, a background thread samples the RSS, CPU usage, thread
+count and I/O bytes of its whole process tree from /proc. Samples are
+attributed to the timing log that appears next in the output directory,
+i.e. to the input file being imported and timed at the time, and every
+timing log gets a `<log>.resources.csv` time series next to it. When Maestro
+runs one input file per process (`--per-file`) the attribution is exact.
+
+Profiling is skipped on platforms without /proc.
+"""
+import collections
+import csv
+import glob
+import os
+import subprocess
+import threading
+import time
+
+from cmd_runner import kill_process_group
+
+RESOURCES_SUFFIX = ".resources.csv"
+DEFAULT_INTERVAL = 0.5
+
+Sample = collections.namedtuple("Sample", [
+    "time", "rss_kb", "cpu_seconds", "cpu_percent", "threads", "read_bytes",
+    "write_bytes"
+])
+ResourceSummary = collections.namedtuple("ResourceSummary",
+                                         ["peak_rss_kb", "cpu_seconds"])
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def is_supported():
+    return os.path.isdir("/proc/self")
+
+
+def get_resources_file(log_file):
+    return log_file[:-len(".log")] + RESOURCES_SUFFIX
+
+
+def _read_stat(pid):
+    """
+    :return: (ppid, utime + stime, cutime + cstime) of `pid`, times in
+        seconds
+    """
+    with open(f"/proc/{pid}/stat", "rb") as f:
+        data = f.read()
+    # The command name may contain spaces, the fields after it do not.
+    fields = data[data.rindex(b")") + 2:].split()
+    ppid = int(fields[1])
+    own = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    children = (int(fields[13]) + int(fields[14])) / _CLOCK_TICKS
+    return ppid, own, children
+
+
+def _get_process_tree(root_pid):
+    children = collections.defaultdict(list)
+    for entry in os.scandir("/proc"):
+        if entry.name.isdigit():
+            try:
+                ppid, _, _ = _read_stat(entry.name)
+            except (OSError, ValueError, IndexError):
+                continue
+            children[ppid].append(int(entry.name))
+    tree = [root_pid]
+    for pid in tree:
+        tree.extend(children.get(pid, ()))
+    return tree
+
+
+def _read_process(pid):
+    rss_kb = threads = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    read_bytes = write_bytes = 0
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                if line.startswith("read_bytes:"):
+                    read_bytes = int(line.split()[1])
+                elif line.startswith("write_bytes:"):
+                    write_bytes = int(line.split()[1])
+    except OSError:
+        pass
+    return rss_kb, threads, read_bytes, write_bytes
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Samples the process tree of `pid` every `interval` seconds until
+    `stop` is called, and writes the samples next to the timing logs that
+    appear in `log_dir`.
+    """
+
+    def __init__(self, pid, log_dir, interval=DEFAULT_INTERVAL):
+        super().__init__(daemon=True)
+        self._pid = pid
+        self._log_dir = log_dir
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._known_logs = set(self._listLogs())
+        self._pending = []
+        self._samples = collections.defaultdict(list)
+        self._last_log = None
+        self._previous = None
+        self._start = time.monotonic()
+
+    def run(self):
+        while True:
+            try:
+                self._sample()
+            except OSError:
+                # The root process has exited
+                break
+            if self._stop_event.wait(self._interval):
+                break
+
+    def stop(self):
+        """
+        Stop sampling and write the time series of every timing log.
+        """
+        self._stop_event.set()
+        self.join()
+        self._attributePending()
+        for log_file, samples in self._samples.items():
+            with open(get_resources_file(log_file), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(Sample._fields)
+                writer.writerows(samples)
+
+    def _listLogs(self):
+        return glob.glob(os.path.join(self._log_dir, "*.log"))
+
+    def _sample(self):
+        now = time.monotonic()
+        rss_kb = threads = read_bytes = write_bytes = 0
+        cpu_seconds = 0.0
+        for pid in _get_process_tree(self._pid):
+            try:
+                _, own, children = _read_stat(pid)
+                process = _read_process(pid)
+            except (OSError, ValueError, IndexError):
+                if pid == self._pid:
+                    raise OSError(f"Process {pid} has exited")
+                continue
+            # Count the CPU time of reaped children through the root only,
+            # as the live descendants are already counted individually.
+            cpu_seconds += own + (children if pid == self._pid else 0)
+            rss_kb += process[0]
+            threads += process[1]
+            read_bytes += process[2]
+            write_bytes += process[3]
+
+        cpu_percent = 0.0
+        if self._previous is not None:
+            elapsed = now - self._start - self._previous.time
+            if elapsed > 0:
+                cpu_percent = 100 * (cpu_seconds -
+                                     self._previous.cpu_seconds) / elapsed
+        sample = Sample(round(now - self._start, 3), rss_kb,
+                        round(cpu_seconds, 2), round(cpu_percent, 1), threads,
+                        read_bytes, write_bytes)
+        self._previous = sample
+        self._pending.append(sample)
+
+        new_logs = set(self._listLogs()) - self._known_logs
+        if new_logs:
+            self._known_logs |= new_logs
+            self._last_log = max(new_logs, key=os.path.getmtime)
+            self._attributePending()
+
+    def _attributePending(self):
+        if self._last_log is not None:
+            self._samples[self._last_log].extend(self._pending)
+            self._pending = []
+
+
+def run_profiled(cmd,
+                 log_dir,
+                 interval=DEFAULT_INTERVAL,
+                 monitor=None,
+                 **kwargs):
+    """
+    Run `cmd` to completion while sampling its resource usage for the timing
+    logs written to `log_dir`. Sampling is disabled when `interval` is 0 or
+    /proc is not available. The command runs in its own session, so it can be
+    killed with all its children.
+
+    :param monitor: optional perf_monitor.LiveMonitor to register the
+        process with
+    :param kwargs: passed on to subprocess.Popen
+    :return: exit code of the command
+    """
+    proc = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+    sampler = None
+    if interval and is_supported():
+        sampler = ResourceSampler(proc.pid, log_dir, interval)
+        sampler.start()
+    if monitor:
+        monitor.register(log_dir, proc)
+    try:
+        return proc.wait()
+    except BaseException:
+        kill_process_group(proc.pid)
+        raise
+    finally:
+        if monitor:
+            monitor.unregister(log_dir)
+        if sampler:
+            sampler.stop()
+
+
+def read_resource_summaries(directory):
+    """
+    :return: ResourceSummary of every timing log in `directory`, keyed by the
+        timing log name
+    """
+    summaries = {}
+    for resources_file in glob.glob(
+            os.path.join(directory, "*" + RESOURCES_SUFFIX)):
+        with open(resources_file, newline="") as f:
+            rows = list(csv.DictReader(f))
+        if not rows:
+            continue
+        log_name = os.path.basename(
+            resources_file)[:-len(RESOURCES_SUFFIX)] + ".log"
+        summaries[log_name] = ResourceSummary(
+            peak_rss_kb=max(int(row["rss_kb"]) for row in rows),
+            cpu_seconds=float(rows[-1]["cpu_seconds"]) -
+            float(rows[0]["cpu_seconds"]))
+    return summaries
@@ -0,0 +1,139 @@
+"""
+Runs the Maestro benchmarks as several isolated Maestro instances.
+
+The input files are split into shards, and every shard runs in its own
+Maestro process with its own command file and output directory, so that
+caches and memory growth from one shard cannot skew the timings of another.
+Once all instances are done their timing logs are merged into the main
+output directory.
+"""
+import concurrent.futures
+import glob
+import logging
+import os
+import platform
+import subprocess
+
+from perf_profiler import DEFAULT_INTERVAL, RESOURCES_SUFFIX, run_profiled
+from sharding import split_into_shards
+from telemetry import traced
+
+SHARDS_DIR_NAME = "shards"
+CMD_FILE_NAME = "cmd_file.cmd"
+MAESTRO_OUTPUT_FILE_NAME = "maestro_output.txt"
+PERFORMANCE_LOGS_DIR_NAME = "performance_logs"
+
+
+def get_maestro_executable():
+    """
+    Return $SCHRODINGER_PERFORMANCE_TEST_MAESTRO if set (e.g. a stub script
+    for testing the scheduler), or the Maestro of $SCHRODINGER.
+    """
+    return os.getenv("SCHRODINGER_PERFORMANCE_TEST_MAESTRO") or os.path.join(
+        os.getenv("SCHRODINGER", ""), "maestro")
+
+
+def get_maestro_args():
+    if platform.system() == "Darwin":
+        return ["-console"]
+    elif platform.system() == "Linux":
+        return ["-SGL"]
+    return []
+
+
+@traced()
+def run_sharded(input_files,
+                output_dir,
+                prepare_cmd_string,
+                instances=1,
+                per_file=False,
+                executable=None,
+                sample_interval=DEFAULT_INTERVAL,
+                monitor=None,
+                weights=None):
+    """
+    Run the benchmarks for `input_files` in up to `instances` concurrent
+    Maestro processes and merge their timing logs into `output_dir`.
+
+    :param prepare_cmd_string: callable taking the input files of a shard
+        and the directory its timing logs go to, and returning the Maestro
+        command script for the shard
+    :param per_file: whether to start a fresh Maestro for every input file
+        instead of one per shard
+    :param executable: Maestro executable, see `get_maestro_executable`
+    :param sample_interval: seconds between resource samples of each
+        instance, 0 to disable profiling
+    :param monitor: optional perf_monitor.LiveMonitor following the progress
+        of the instances
+    :param weights: optional dict mapping every input file to its expected
+        cost, used to balance the shards, see `sharding.split_into_shards`
+    :return: number of shards whose Maestro exited with an error
+    """
+    executable = executable or get_maestro_executable()
+    if per_file:
+        shards = [[input_file] for input_file in input_files]
+    else:
+        shards = split_into_shards(input_files, instances, weights)
+    logging.info(f"Running {len(input_files)} input files in {len(shards)} "
+                 f"shards on {instances} Maestro instances")
+
+    shard_dirs = [
+        os.path.join(output_dir, SHARDS_DIR_NAME, f"shard_{i}")
+        for i in range(len(shards))
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=instances) as pool:
+        returncodes = list(
+            pool.map(
+                lambda shard, shard_dir: _run_shard(
+                    shard, shard_dir, prepare_cmd_string, executable,
+                    sample_interval, monitor),
+                shards, shard_dirs))
+
+    for shard_dir in shard_dirs:
+        _merge_logs(shard_dir, output_dir)
+    failures = sum(1 for returncode in returncodes if returncode != 0)
+    if failures:
+        logging.error(f"{failures} Maestro instances exited with an error, "
+                      f"see {MAESTRO_OUTPUT_FILE_NAME} in their shard "
+                      "directories")
+    return failures
+
+
+@traced("maestro shard")
+def _run_shard(input_files, shard_dir, prepare_cmd_string, executable,
+               sample_interval, monitor):
+    os.makedirs(shard_dir, exist_ok=True)
+    cmd_file = os.path.join(shard_dir, CMD_FILE_NAME)
+    with open(cmd_file, "w") as f:
+        f.write(prepare_cmd_string(input_files, shard_dir))
+
+    cmd = [executable] + get_maestro_args() + ["-c", cmd_file]
+    # Point the instance at its own output directory, so that anything it
+    # writes relative to it stays separate from the other instances.
+    env = dict(os.environ, SCHRODINGER_PERFORMANCE_TEST_OUTPUT=shard_dir)
+    logging.info(f"Running {cmd}")
+    with open(os.path.join(shard_dir, MAESTRO_OUTPUT_FILE_NAME), "w") as f:
+        returncode = run_profiled(cmd,
+                                  shard_dir,
+                                  sample_interval,
+                                  monitor,
+                                  env=env,
+                                  cwd=shard_dir,
+                                  stdout=f,
+                                  stderr=subprocess.STDOUT)
+    logging.info(f"Maestro run for {shard_dir} completed with {returncode}")
+    return returncode
+
+
+def _merge_logs(shard_dir, output_dir):
+    for sub_dir in ("", PERFORMANCE_LOGS_DIR_NAME):
+        target_dir = os.path.join(output_dir, sub_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        for log_file in glob.glob(os.path.join(
+                shard_dir, sub_dir, "*.log")) + glob.glob(
+                    os.path.join(shard_dir, sub_dir, "*" + RESOURCES_SUFFIX)):
+            target = os.path.join(target_dir, os.path.basename(log_file))
+            if os.path.exists(target):
+                logging.warning(f"Overwriting {target} with {log_file}, "
+                                "input file names are not unique")
+            os.replace(log_file, target)
@@ -0,0 +1,164 @@
+"""
+Content-addressed cache of decompressed performance test inputs.
+
+Compressed inputs (`.maegz`, `.mae.gz`, `.prjzip`, `.prj.zip`) are
+decompressed once, streaming, into `<cache dir>/<content hash>/`, so
+benchmarks can time opening the uncompressed copy separately from the
+compressed original without decompressing it again on every run. Put the
+cache on a tmpfs (e.g. /dev/shm) to also keep disk reads out of the
+uncompressed timings.
+
+A staged copy is named after its original with an `.uncompressed` infix,
+e.g. `ligands.maegz` is staged as `ligands.maegz.uncompressed.mae`, so the
+timing logs of both stay apart. Once the cache grows past its size limit,
+the least recently used copies not staged by the current run are evicted.
+"""
+import collections
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+from perf_corpus import CHUNK_SIZE, ZIP_EXTENSIONS
+
+DEFAULT_MAX_MB = 4096
+STAGED_INFIX = ".uncompressed"
+
+StagedInput = collections.namedtuple(
+    "StagedInput", ["path", "staged_path", "seconds", "cached"])
+
+
+def get_staged_name(path):
+    """
+    :return: name of the uncompressed copy of the input at `path`, or None if
+        the input is not compressed
+    """
+    name = os.path.basename(path)
+    lower_name = name.lower()
+    if lower_name.endswith(".maegz") or lower_name.endswith(".mae.gz"):
+        return name + STAGED_INFIX + ".mae"
+    if lower_name.endswith(ZIP_EXTENSIONS):
+        return name + STAGED_INFIX + ".prj"
+    return None
+
+
+def _decompress_gzip(path, staged_path):
+    with gzip.open(path, "rb") as src, open(staged_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _extract_project(path, staged_path):
+    """
+    Extract a zipped project; its single top level `.prj` directory, or the
+    whole archive if there is none, becomes `staged_path`.
+    """
+    extract_dir = staged_path + ".extract"
+    with zipfile.ZipFile(path) as archive:
+        archive.extractall(extract_dir)
+    top_level = os.listdir(extract_dir)
+    if len(top_level) == 1 and top_level[0].lower().endswith(".prj"):
+        os.replace(os.path.join(extract_dir, top_level[0]), staged_path)
+        os.rmdir(extract_dir)
+    else:
+        os.replace(extract_dir, staged_path)
+
+
+def _get_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path) for name in files)
+
+
+class StagingCache:
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_MB << 20):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        # Content hashes staged or used by this run, never evicted
+        self._pinned = set()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def stage(self, entry):
+        """
+        Return the uncompressed copy of a compressed input, decompressing it
+        if it is not cached yet.
+
+        :param entry: perf_corpus.CorpusEntry of the input
+        :return: StagedInput, or None if the input is not compressed, has no
+            content hash or does not fit in the cache
+        """
+        staged_name = get_staged_name(entry.path)
+        if staged_name is None or entry.hash is None or os.path.isdir(
+                entry.path):
+            return None
+        entry_dir = os.path.join(self._cache_dir, entry.hash)
+        staged_path = os.path.join(entry_dir, staged_name)
+        self._pinned.add(entry.hash)
+        if os.path.exists(staged_path):
+            # The entry directory's mtime records its last use.
+            os.utime(entry_dir)
+            return StagedInput(entry.path, staged_path, 0.0, True)
+
+        if entry.uncompressed_size > self._max_bytes:
+            logging.warning(f"Not staging {entry.path}: its "
+                            f"{entry.uncompressed_size >> 20} MB do not fit "
+                            f"in the {self._max_bytes >> 20} MB cache")
+            self._pinned.discard(entry.hash)
+            return None
+        self._evict(entry.uncompressed_size)
+
+        os.makedirs(entry_dir, exist_ok=True)
+        # Decompress next to the final path, so an interrupted run never
+        # leaves a truncated copy behind.
+        tmp_path = tempfile.mkdtemp(dir=entry_dir, prefix=".staging")
+        start = time.perf_counter()
+        try:
+            if entry.path.lower().endswith(ZIP_EXTENSIONS):
+                _extract_project(entry.path,
+                                 os.path.join(tmp_path, staged_name))
+            else:
+                _decompress_gzip(entry.path,
+                                 os.path.join(tmp_path, staged_name))
+            os.replace(os.path.join(tmp_path, staged_name), staged_path)
+        except (OSError, EOFError, zipfile.BadZipFile) as err:
+            logging.warning(f"Could not stage {entry.path}: {err}")
+            self._pinned.discard(entry.hash)
+            return None
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        seconds = time.perf_counter() - start
+        logging.info(f"Staged {entry.path} as {staged_path} in "
+                     f"{seconds:.2f} s")
+        return StagedInput(entry.path, staged_path, seconds, False)
+
+    def _evict(self, needed_bytes):
+        """
+        Remove the least recently used entries not pinned by this run until
+        `needed_bytes` more fit in the cache.
+        """
+        entries = []
+        total = 0
+        with os.scandir(self._cache_dir) as it:
+            for dir_entry in it:
+                if not dir_entry.is_dir(follow_symlinks=False):
+                    continue
+                size = _get_size(dir_entry.path)
+                total += size
+                entries.append(
+                    (dir_entry.stat().st_mtime, dir_entry.name, size))
+        entries.sort()
+        for _, name, size in entries:
+            if total + needed_bytes <= self._max_bytes:
+                break
+            if name in self._pinned:
+                continue
+            logging.info(f"Evicting {name} ({size >> 20} MB) from the "
+                         "staging cache")
+            shutil.rmtree(os.path.join(self._cache_dir, name),
+                          ignore_errors=True)
+            total -= size
@@ -0,0 +1,186 @@
+"""
+Append-only SQLite store of performance test results, and regression
+detection between runs.
+
+Every run is recorded with its git commit and OS; its timings are keyed by
+input file, kind of timing ("command" or "graphics") and timing name. The
+content hashes of the timed inputs are recorded as well, so unchanged
+inputs can be skipped when the same commit is tested again.
+"""
+import collections
+import sqlite3
+import statistics
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    git_commit TEXT NOT NULL,
+    os TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS timings (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    kind TEXT NOT NULL,
+    input_file TEXT NOT NULL,
+    name TEXT NOT NULL,
+    repeat INTEGER NOT NULL DEFAULT 0,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_run ON timings(run_id);
+CREATE TABLE IF NOT EXISTS inputs (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    input_file TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+# Scales the median absolute deviation to a standard deviation estimate for
+# normally distributed samples.
+MAD_SCALE = 1.4826
+
+Run = collections.namedtuple("Run",
+                             ["run_id", "started_at", "git_commit", "os"])
+Comparison = collections.namedtuple("Comparison", [
+    "kind", "input_file", "name", "baseline_median", "candidate_median",
+    "relative_change", "regression"
+])
+
+
+class ResultsStore:
+
+    def __init__(self, db_path):
+        self._conn = sqlite3.connect(db_path)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def startRun(self, git_commit, os_name):
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        with self._conn:
+            self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?)",
+                               (run_id, time.time(), git_commit, os_name))
+        return run_id
+
+    def addTimings(self, run_id, kind, timings):
+        """
+        :param timings: iterable of (input file, name, repeat, value)
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO timings VALUES (?, ?, ?, ?, ?, ?)",
+                ((run_id, kind, input_file, name, repeat, value)
+                 for input_file, name, repeat, value in timings))
+
+    def addInputs(self, run_id, inputs):
+        """
+        :param inputs: iterable of (input file, content hash) of the inputs
+            the run timed
+        """
+        with self._conn:
+            self._conn.executemany("INSERT INTO inputs VALUES (?, ?, ?)",
+                                   ((run_id, input_file, content_hash)
+                                    for input_file, content_hash in inputs))
+
+    def getInputHashes(self, git_commit, os_name):
+        """
+        :return: set of (input file, content hash) of the inputs timed by
+            the runs of a commit
+        """
+        rows = self._conn.execute(
+            "SELECT input_file, hash FROM inputs JOIN runs USING (run_id) "
+            "WHERE git_commit = ? AND os = ?", (git_commit, os_name))
+        return set(rows)
+
+    def getRuns(self, os_name=None):
+        """
+        :return: runs ordered from oldest to newest
+        """
+        query = "SELECT * FROM runs"
+        params = ()
+        if os_name:
+            query += " WHERE os = ?"
+            params = (os_name, )
+        rows = self._conn.execute(query + " ORDER BY started_at", params)
+        return [Run(*row) for row in rows]
+
+    def getSamples(self, run_ids):
+        """
+        :return: timing values of all the given runs keyed by
+            (kind, input file, name)
+        """
+        samples = collections.defaultdict(list)
+        placeholders = ", ".join("?" * len(run_ids))
+        rows = self._conn.execute(
+            "SELECT kind, input_file, name, value FROM timings "
+            f"WHERE run_id IN ({placeholders})", list(run_ids))
+        for kind, input_file, name, value in rows:
+            samples[(kind, input_file, name)].append(value)
+        return samples
+
+
+def get_default_comparison_runs(store, os_name):
+    """
+    Return the run ids to compare by default: all runs of the latest tested
+    commit as the candidate, and all runs of the commit tested before it as
+    the baseline.
+    """
+    runs = store.getRuns(os_name)
+    if not runs:
+        return [], []
+    candidate_commit = runs[-1].git_commit
+    candidate = [
+        run.run_id for run in runs if run.git_commit == candidate_commit
+    ]
+    baseline_commit = next(
+        (run.git_commit
+         for run in reversed(runs) if run.git_commit != candidate_commit),
+        None)
+    baseline = [
+        run.run_id for run in runs if run.git_commit == baseline_commit
+    ]
+    return baseline, candidate
+
+
+def _median_and_mad(values):
+    median = statistics.median(values)
+    mad = statistics.median(abs(value - median) for value in values)
+    return median, mad * MAD_SCALE
+
+
+def compare_runs(store,
+                 baseline_ids,
+                 candidate_ids,
+                 threshold=0.05,
+                 mad_factor=3.0):
+    """
+    Compare the timings of two sets of runs.
+
+    A timing regresses when its candidate median exceeds the baseline median
+    both by more than `threshold` (relative) and by more than `mad_factor`
+    times the larger of the two scaled median absolute deviations, so noisy
+    timings need a proportionally bigger slowdown to be flagged.
+
+    :return: list of Comparison, largest relative slowdown first
+    """
+    baseline = store.getSamples(baseline_ids)
+    candidate = store.getSamples(candidate_ids)
+    comparisons = []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        baseline_median, baseline_mad = _median_and_mad(baseline[key])
+        candidate_median, candidate_mad = _median_and_mad(candidate[key])
+        delta = candidate_median - baseline_median
+        if baseline_median:
+            relative_change = delta / baseline_median
+        else:
+            relative_change = float("inf") if delta > 0 else 0.0
+        regression = (relative_change > threshold and delta
+                      > mad_factor * max(baseline_mad, candidate_mad))
+        comparisons.append(
+            Comparison(*key, baseline_median, candidate_median,
+                       relative_change, regression))
+    comparisons.sort(key=lambda comparison: comparison.relative_change,
+                     reverse=True)
+    return comparisons
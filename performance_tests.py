@@ -1,16 +1,38 @@
+import atexit
 import os
 import logging
-import platform
-import csv
 import re
 import sys
-from collections import defaultdict
 import subprocess
 import glob
 import shutil
+import functools
+
+from argparse import ArgumentParser
+
+from git_utils import run_git
+from perf_corpus import (FILE_SUPPORTED_EXTENSIONS, SIZE_CLASSES,
+                         CorpusIndex, find_input_files, get_size_class)
+from perf_logs import (get_repeat_log_name, parse_graphics_log,
+                       parse_timing_logs, read_activity_schema,
+                       read_timing_log_file_name, split_repeat,
+                       write_summary_csv)
+from perf_manifest import LogManifest
+from perf_monitor import LiveMonitor
+from perf_profiler import (DEFAULT_INTERVAL, read_resource_summaries,
+                           run_profiled)
+from perf_scheduler import get_maestro_args, get_maestro_executable, run_sharded
+from perf_staging import DEFAULT_MAX_MB, StagingCache
+from perf_store import (ResultsStore, compare_runs,
+                        get_default_comparison_runs)
+import telemetry
+from telemetry import traced
 
 INPUT_DIR = os.getenv("SCHRODINGER_PERFORMANCE_TEST_INPUT")
 OUTPUT_DIR = os.getenv("SCHRODINGER_PERFORMANCE_TEST_OUTPUT")
+RESULTS_DB_NAME = "results.sqlite"
+CORPUS_INDEX_NAME = "corpus_index.json"
+MANIFEST_NAME = ".timing_manifest.json"
 
 
 def get_csv_name_by_os(name):
@@ -19,19 +41,110 @@ def get_csv_name_by_os(name):
     return name
 
 
-FILE_SUPPORTED_EXTENSIONS = (".mae", ".maegz", ".mae.gz", ".sd", ".sdf", ".pdb")
-PROJECT_SUPPORTED_EXTENSION = (".prj",".prjzip",".prj.zip")
+def get_npz_name(csv_name):
+    return os.path.splitext(csv_name)[0] + ".npz"
 
-def get_input_files():
-    input_files = []
+
+@traced()
+def get_input_files(recursive=False):
     logging.info("Getting input files inside directory: " + INPUT_DIR)
-    for files in os.listdir(INPUT_DIR):
-        if files.endswith(FILE_SUPPORTED_EXTENSIONS) or files.endswith(PROJECT_SUPPORTED_EXTENSION):
-            input_files.append(os.path.join(INPUT_DIR, files))
+    input_files = find_input_files(INPUT_DIR, recursive)
     logging.info(f"Input files found: {input_files}")
     return input_files
 
 
+@traced()
+def select_input_files(input_files, size_classes=None, skip_unchanged=False):
+    """
+    Index the input files and return the entries of those to run, largest
+    first.
+
+    :param size_classes: only keep inputs of these size classes, see
+        `perf_corpus.get_size_class`
+    :param skip_unchanged: skip inputs whose results for the tested commit
+        are already stored
+    :return: list of perf_corpus.CorpusEntry
+    """
+    index = CorpusIndex(os.path.join(OUTPUT_DIR, CORPUS_INDEX_NAME))
+    entries = index.index(input_files)
+    index.save()
+    if size_classes:
+        entries = [
+            entry for entry in entries
+            if get_size_class(entry.uncompressed_size) in size_classes
+        ]
+    if skip_unchanged:
+        store = ResultsStore(get_results_db_path())
+        try:
+            stored = store.getInputHashes(get_tested_commit(),
+                                          sys.platform.lower())
+        finally:
+            store.close()
+        skipped = [
+            entry.path for entry in entries
+            if (_get_input_name(entry.path), entry.hash) in stored
+        ]
+        if skipped:
+            logging.info(f"Skipping {len(skipped)} unchanged inputs with "
+                         f"stored results: {skipped}")
+        entries = [entry for entry in entries if entry.path not in skipped]
+    return sorted(entries,
+                  key=lambda entry: entry.uncompressed_size,
+                  reverse=True)
+
+
+@traced()
+def stage_inputs(inputs, stage_dir, max_mb=DEFAULT_MAX_MB):
+    """
+    Decompress the compressed inputs into the staging cache in `stage_dir`
+    and run their uncompressed copies right after them, so compressed inputs
+    are timed both compressed and uncompressed.
+
+    :param inputs: perf_corpus.CorpusEntry of the inputs to run
+    :return: (paths of the inputs to run, dict of the uncompressed size of
+        every path, dict of the input name of every path, see
+        `get_log_name`)
+    """
+    cache = StagingCache(stage_dir, max_mb << 20)
+    input_files = []
+    sizes = {}
+    names = {}
+    staged = []
+    for entry in inputs:
+        input_files.append(entry.path)
+        sizes[entry.path] = entry.uncompressed_size
+        names[entry.path] = _get_input_name(entry.path)
+        if staged_input := cache.stage(entry):
+            input_files.append(staged_input.staged_path)
+            sizes[staged_input.staged_path] = entry.uncompressed_size
+            # Named as if next to the original, which keeps it unique
+            names[staged_input.staged_path] = os.path.join(
+                os.path.dirname(names[entry.path]),
+                os.path.basename(staged_input.staged_path))
+            staged.append(staged_input)
+    decompressed = [
+        staged_input for staged_input in staged if not staged_input.cached
+    ]
+    seconds = sum(staged_input.seconds for staged_input in decompressed)
+    logging.info(f"Staged {len(staged)} compressed inputs in {stage_dir}: "
+                 f"decompressed {len(decompressed)} in {seconds:.2f} s, "
+                 f"reused {len(staged) - len(decompressed)}")
+    return input_files, sizes, names
+
+
+def _get_input_name(path):
+    return os.path.relpath(path, INPUT_DIR)
+
+
+def get_log_name(input_name):
+    """
+    Return the name of the timing log of an input, from its path relative
+    to the input directory, e.g. "sub/a.mae" -> "sub__a.mae.log", so that
+    nested inputs of the same name do not share a log.
+    """
+    return input_name.replace(os.sep, "__") + ".log"
+
+
 def prepare_cmd_string_python_function(input_files):
     cmd_string = ""
     for file in input_files:
@@ -54,183 +167,563 @@ def file_or_project_open(file_path):
     else:
         return f"projectopen {file_path}\n"
 
-def prepare_cmd_string(input_files):
+def prepare_cmd_string(input_files,
+                       output_dir=None,
+                       repeat=1,
+                       warmup=0,
+                       input_names=None):
+    """
+    Each input file is first opened `warmup` times without timing, then
+    timed `repeat` times. Repeated runs log to <log name>.rep<N>.log so they
+    do not overwrite each other.
+
+    :param input_names: input name of every input file, see `get_log_name`;
+        by default their paths relative to the input directory
+    """
+    output_dir = output_dir or OUTPUT_DIR
     cmd_string = ""
     for file in input_files:
-        output_log_file = os.path.join(OUTPUT_DIR,
-                                       os.path.basename(file) + ".log")
-        cmd_string += "projectclose\n"
-        cmd_string += file_or_project_open(file)
-        cmd_string += f"timingsetup file={output_log_file}\n"
-        cmd_string += "timingstart\n"
-        cmd_string += "entrywsinclude all\n"
-        cmd_string += "\n\n"
-        cmd_string += "timingstop\n"
+        log_name = get_log_name(input_names[file] if input_names else
+                                _get_input_name(file))
+        for _ in range(warmup):
+            cmd_string += "projectclose\n"
+            cmd_string += file_or_project_open(file)
+            cmd_string += "entrywsinclude all\n"
+        for i in range(repeat):
+            if repeat > 1:
+                output_log_file = os.path.join(
+                    output_dir, get_repeat_log_name(log_name, i))
+            else:
+                output_log_file = os.path.join(output_dir, log_name)
+            cmd_string += "projectclose\n"
+            cmd_string += file_or_project_open(file)
+            cmd_string += f"timingsetup file={output_log_file}\n"
+            cmd_string += "timingstart\n"
+            cmd_string += "entrywsinclude all\n"
+            cmd_string += "\n\n"
+            cmd_string += "timingstop\n"
     cmd_string += "quit"
     return cmd_string
 
 
-def run_maestro(cmd_string):
-    maestro_executable = os.path.join(os.getenv("SCHRODINGER", None),
-                                      "maestro")
-    args = []
-    if platform.system() == "Darwin":
-        args.append("-console")
-    elif platform.system() == "Linux":
-        args.append("-SGL")
+@traced()
+def run_maestro(cmd_string, sample_interval=DEFAULT_INTERVAL, monitor=None):
+    maestro_executable = get_maestro_executable()
+    args = get_maestro_args()
     temp_file = os.path.join(OUTPUT_DIR, "cmd_file.cmd")
     with open(temp_file, "w") as f:
         f.write(cmd_string)
-
-
-#logging.info("Command file created", temp_file)
-# args.append("-c")
-# args.append(temp_file)
+    args += ["-c", temp_file]
     logging.info(f"Running {maestro_executable} {args}")
-    subprocess.run([maestro_executable] + args)
-    logging.info("Maestro run completed")
+    returncode = run_profiled([maestro_executable] + args, OUTPUT_DIR,
+                              sample_interval, monitor)
+    logging.info(f"Maestro run completed with {returncode}")
     os.remove(temp_file)
     logging.info("Removing temporary command file")
+    return returncode
 
 
-def parse_time_entry(entry):
-    # Split the string on the first occurrence of '='
-    parts = entry.split('=', 1)
-
-    if len(parts) != 2:
-        return None  # Return None if the format is incorrect
-
-    # Trim the left and right parts
-    left_part = parts[0].strip()
-    right_part = parts[1].strip()
-
-    # Extract the time value and ensure it ends with 'ms'
-    if right_part.endswith('ms'):
-        try:
-            time_value = int(right_part[:-2].strip())
-        except ValueError:
-            return None  # Handle conversion error
-
-        return left_part, time_value
-
-    return None
-
-
-
-def process_files_in_directory(directory_path, output_csv):
-    # Dictionary to hold the data, with filenames as keys
-    data = defaultdict(dict)
-    all_functions = set()
-
-    # Iterate through each file in the directory
-    for filename in os.listdir(directory_path):
-        if filename.endswith(".log"):
-            file_path = os.path.join(directory_path, filename)
-            logging.info(f"Processing file: {file_path}")
-            with open(file_path, 'r') as file:
-                lines = file.readlines()
-                file_name = lines[0].strip().strip('"')
-                for line in lines[1:]:
-                    function_name , value = parse_time_entry(line)
-                    if function_name is not None:
-                        if data[file_name].get(function_name) is None:
-                            data[file_name][function_name] = 0
-                        data[file_name][function_name] += value
-                        all_functions.add(function_name)
-                        
-
-    # Convert the collected data into a CSV file
-    with open(output_csv, 'w', newline='') as csvfile:
-        fieldnames = ['Filename'] + sorted(all_functions)
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        writer.writeheader()
-        for file_name, functions in data.items():
-            row = {'Filename': file_name}
-            for function in all_functions:
-                row[function] = functions.get(function, "")
-            writer.writerow(row)
-
+@traced()
+def process_files_in_directory(directory_path,
+                               output_csv,
+                               jobs=None,
+                               incremental=True,
+                               resources=None):
+    """
+    :param incremental: only parse the logs that changed since the last
+        call for `directory_path`, see `perf_manifest.LogManifest`
+    :param resources: optional perf_profiler.ResourceSummary per log name,
+        added as peak memory and CPU time columns
+    """
+    if not os.path.isdir(directory_path):
+        # e.g. Maestro was killed before writing any command timing log
+        logging.warning(f"No timing logs directory {directory_path}")
+        table, _ = parse_timing_logs([], jobs)
+        table.writeCsv(output_csv)
+        table.writeNpz(get_npz_name(output_csv))
+        return table
+    log_files = sorted(
+        os.path.join(directory_path, filename)
+        for filename in os.listdir(directory_path)
+        if filename.endswith(".log"))
+    logging.info(
+        f"Processing {len(log_files)} timing logs in {directory_path}")
+    if incremental:
+        manifest = LogManifest(os.path.join(directory_path, MANIFEST_NAME),
+                               "command")
+        table, counters = manifest.parse(log_files, jobs)
+        manifest.save()
+    else:
+        table, counters = parse_timing_logs(log_files, jobs)
+    extra_columns = None
+    if resources:
+        # Command rows are named by the input file in the log header, not
+        # by the log name the resources are keyed by.
+        row_keys = {}
+        for path in log_files:
+            log_name = os.path.basename(path)
+            file_name = (read_timing_log_file_name(path)
+                         if log_name in resources else None)
+            if file_name is not None:
+                row_keys[log_name] = (file_name, split_repeat(log_name)[1])
+        extra_columns = get_resource_columns(resources, row_keys)
+    table.writeCsv(output_csv, extra_columns=extra_columns)
+    table.writeNpz(get_npz_name(output_csv), extra_columns=extra_columns)
+    logging.info(f"Parsed {counters['entries']} timing entries from "
+                 f"{counters['files']} files, skipped "
+                 f"{counters['malformed_lines']} malformed lines and "
+                 f"{counters['empty_files']} empty files")
     logging.info(f"CSV file '{output_csv}' created successfully.")
+    return table
 
 
-def perform_cleanup(directory):
+def get_resource_columns(resources, row_keys):
+    """
+    :param resources: perf_profiler.ResourceSummary per timing log name
+    :param row_keys: (file name, repeat) of the table row of every timing
+        log name
+    :return: peak memory and CPU time columns, see `TimingTable.getColumn`.
+        A row timed by several logs gets their highest peak memory and their
+        total CPU time, like its timings are summed.
+    """
+    peak_rss_mb = {}
+    cpu_seconds = {}
+    for log_name, summary in resources.items():
+        key = row_keys.get(log_name)
+        if key is None:
+            continue
+        peak_rss_mb[key] = max(peak_rss_mb.get(key, 0),
+                               round(summary.peak_rss_kb / 1024, 1))
+        cpu_seconds[key] = round(
+            cpu_seconds.get(key, 0) + summary.cpu_seconds, 2)
+    return {"Peak RSS (MB)": peak_rss_mb, "CPU (s)": cpu_seconds}
+
+
+@traced()
+def perform_cleanup(directory, keep=()):
+    """
+    Empty `directory`, except for the entries named in `keep`.
+    """
     logging.info("Performing cleanup in directory: " + directory)
 
-    shutil.rmtree(directory, ignore_errors=True)
-    os.makedirs(directory)
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name in keep:
+            continue
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
     logging.info("Cleanup completed.")
 
 
-def write_graphics_output_to_csv(input_files, output_file):
+@traced()
+def write_graphics_output_to_csv(log_files,
+                                 output_file,
+                                 activities=None,
+                                 resources=None,
+                                 jobs=None,
+                                 manifest_file=None):
     """
-    Parses multiple input files to create a structured CSV with activities as headers and their corresponding 'Time (s)' values.
-    
-    Args:
-        input_files (list of tuples): A list where each tuple contains the path to the input text file and the associated filename.
-        output_file (str): The path to the output CSV file.
+    Parse the graphics timing logs in parallel and write the time in seconds
+    of every activity per log, as CSV and as a NumPy archive next to it.
+
+    :param log_files: paths of the graphics timing logs
+    :param activities: activities to report in this order, by default all
+        activities found in the logs
+    :param resources: optional perf_profiler.ResourceSummary per log name,
+        added as peak memory and CPU time columns
+    :param manifest_file: if given, only parse the logs that changed since
+        the manifest was written, see `perf_manifest.LogManifest`
+    :return: perf_logs.TimingTable of the activity times
+    """
+    parser = parse_graphics_log
+    if activities:
+        parser = functools.partial(parse_graphics_log,
+                                   activities=frozenset(activities))
+    if manifest_file:
+        manifest = LogManifest(manifest_file,
+                               f"graphics:{sorted(activities or [])}")
+        table, counters = manifest.parse(log_files, jobs, parser)
+        manifest.save()
+    else:
+        table, counters = parse_timing_logs(log_files, jobs, parser)
+    logging.info(f"Parsed {counters['entries']} graphics timings from "
+                 f"{counters['files']} files, skipped "
+                 f"{counters['malformed_lines']} malformed lines")
+    extra_columns = None
+    if resources:
+        row_keys = {name: split_repeat(name) for name in resources}
+        extra_columns = get_resource_columns(resources, row_keys)
+    table.writeCsv(output_file, activities, extra_columns)
+    table.writeNpz(get_npz_name(output_file), activities, extra_columns)
+    return table
+
+
+def process_graphics_output_in_directory(directory,
+                                         output_file,
+                                         activities=None,
+                                         jobs=None,
+                                         incremental=True,
+                                         resources=None):
+    """
+    :param resources: perf_profiler.ResourceSummary per log name, read from
+        `directory` by default
     """
-    activities = [
-        "Main Drawing", "Onscreen Drawing", "Drawing Setup",
-        "Structure Drawing", "Python Drawing", "Overlay Drawing",
-        "Command Handling", "Regenerate DGOs", "Regenerate main CT"
-    ]
-
-    with open(output_file, 'w', newline='') as outfile:
-        writer = csv.writer(outfile)
-        # Write the header row once
-        writer.writerow(["Filename"] + activities)
-
-        for input_file, filename in input_files:
-            # Initialize a dictionary to hold Time (s) values for each activity
-            activity_times = {activity: "000.000" for activity in activities}
-
-            with open(input_file, 'r') as infile:
-                lines = infile.readlines()
-
-                for line in lines:
-                    clean_line = line.strip().replace('"', '').strip()
-                    if clean_line and not clean_line.startswith(
-                            "Timing") and not clean_line.startswith("Period"):
-                        parts = clean_line.split('\t')
-                        if len(parts) >= 2:
-                            activity = parts[0].strip()
-                            time_value = parts[1].strip().replace(
-                                "\t", "")  # Remove additional tabs
-                            if activity in activity_times:
-                                activity_times[activity] = time_value
-
-            # Write the row with the filename and activity times
-            writer.writerow(
-                [filename] +
-                [activity_times[activity] for activity in activities])
-
-
-def process_graphics_output_in_directory(directory, output_file):
     logging.info("Processing graphics output in directory: " + directory)
-    input_files = glob.glob(os.path.join(directory, "*.log"))
-    input_data = []
-    for file in input_files:
-        input_data.append((file, os.path.basename(file)))
-    write_graphics_output_to_csv(input_data, output_file)
+    log_files = sorted(glob.glob(os.path.join(directory, "*.log")))
+    manifest_file = None
+    if incremental:
+        manifest_file = os.path.join(directory, MANIFEST_NAME)
+    if resources is None:
+        resources = read_resource_summaries(directory)
+    table = write_graphics_output_to_csv(log_files, output_file, activities,
+                                         resources, jobs, manifest_file)
     logging.info("Graphics output processed successfully at : " + output_file)
+    return table
+
 
+def get_results_db_path():
+    return os.getenv("SCHRODINGER_PERFORMANCE_TEST_RESULTS_DB",
+                     os.path.join(OUTPUT_DIR, RESULTS_DB_NAME))
 
-def main():
-    perform_cleanup(OUTPUT_DIR)
-    input_files = get_input_files()
+
+def get_tested_commit():
+    """
+    Return the mmshare commit being tested, from
+    $SCHRODINGER_PERFORMANCE_TEST_COMMIT or the $SCHRODINGER_SRC checkout.
+    """
+    if commit := os.getenv("SCHRODINGER_PERFORMANCE_TEST_COMMIT"):
+        return commit
+    src = os.getenv("SCHRODINGER_SRC")
+    if src and os.path.isdir(os.path.join(src, "mmshare")):
+        try:
+            return run_git(["rev-parse", "HEAD"],
+                           cwd=os.path.join(src, "mmshare")).strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return "unknown"
+
+
+def _iter_resources(resources):
+    """
+    :param resources: perf_profiler.ResourceSummary per timing log name
+    :return: iterator of (log name without its repeat index, repeat, metric,
+        value), like `TimingTable.iterTimings`
+    """
+    for log_name, summary in resources.items():
+        log_name, repeat = split_repeat(log_name)
+        yield log_name, repeat, "peak_rss_mb", summary.peak_rss_kb / 1024
+        yield log_name, repeat, "cpu_seconds", summary.cpu_seconds
+
+
+@traced()
+def store_results(command_table, graphics_table, resources=None, inputs=()):
+    store = ResultsStore(get_results_db_path())
+    try:
+        run_id = store.startRun(get_tested_commit(), sys.platform.lower())
+        store.addTimings(run_id, "command",
+                         ((file_name, function, repeat, value)
+                          for file_name, repeat, function, value in
+                          command_table.iterTimings()))
+        store.addTimings(run_id, "graphics",
+                         ((log_name, activity, repeat, value)
+                          for log_name, repeat, activity, value in
+                          graphics_table.iterTimings()))
+        if resources:
+            store.addTimings(run_id, "resources",
+                             ((log_name, name, repeat, value)
+                              for log_name, repeat, name, value in
+                              _iter_resources(resources)))
+        # Only inputs with graphics timings count as timed for
+        # --skip-unchanged, not those of a killed Maestro run
+        timed = {log_name for log_name, *_ in graphics_table.iterTimings()}
+        store.addInputs(
+            run_id,
+            ((_get_input_name(entry.path), entry.hash)
+             for entry in inputs if entry.hash and
+             get_log_name(_get_input_name(entry.path)) in timed))
+    finally:
+        store.close()
+    logging.info(f"Results stored as run {run_id} in {get_results_db_path()}")
+
+
+def main(instances=1,
+         per_file=False,
+         repeat=1,
+         warmup=0,
+         sample_interval=DEFAULT_INTERVAL,
+         graphics_schema=None,
+         live=False,
+         file_timeout=None,
+         recursive=False,
+         size_classes=None,
+         skip_unchanged=False,
+         stage_dir=None,
+         stage_max_mb=DEFAULT_MAX_MB):
+    activities = None
+    if graphics_schema:
+        activities = read_activity_schema(graphics_schema)
+    keep = [RESULTS_DB_NAME, CORPUS_INDEX_NAME]
+    # Keep a staging cache inside the output directory across runs
+    if stage_dir:
+        stage_parent, stage_name = os.path.split(os.path.abspath(stage_dir))
+        if stage_parent == os.path.abspath(OUTPUT_DIR):
+            keep.append(stage_name)
+    perform_cleanup(OUTPUT_DIR, keep=keep)
+    inputs = select_input_files(get_input_files(recursive), size_classes,
+                                skip_unchanged)
+    input_files = [entry.path for entry in inputs]
+    sizes = {entry.path: entry.uncompressed_size for entry in inputs}
+    names = {entry.path: _get_input_name(entry.path) for entry in inputs}
+    if stage_dir and inputs:
+        input_files, sizes, names = stage_inputs(inputs, stage_dir,
+                                                 stage_max_mb)
     logging.info(f"input_files: {input_files}")
-    cmd_string = prepare_cmd_string(input_files)
-    run_maestro(cmd_string)
+    if not input_files:
+        logging.info("No input files to run")
+        return
+    monitor = None
+    if live or file_timeout:
+        monitor = LiveMonitor(OUTPUT_DIR, len(input_files) * repeat,
+                              file_timeout)
+        monitor.start()
+    if instances > 1 or per_file:
+        run_sharded(input_files,
+                    OUTPUT_DIR,
+                    functools.partial(prepare_cmd_string,
+                                      repeat=repeat,
+                                      warmup=warmup,
+                                      input_names=names),
+                    instances=instances,
+                    per_file=per_file,
+                    sample_interval=sample_interval,
+                    monitor=monitor,
+                    weights=sizes)
+    else:
+        cmd_string = prepare_cmd_string(input_files,
+                                        repeat=repeat,
+                                        warmup=warmup,
+                                        input_names=names)
+        run_maestro(cmd_string, sample_interval, monitor)
+    if monitor:
+        monitor.stop()
+        if monitor.killed:
+            logging.error(f"Killed hung Maestro runs in {monitor.killed}, "
+                          "their remaining input files were not timed")
+
+    command_table, graphics_table = aggregate(activities)
+    store_results(command_table, graphics_table,
+                  read_resource_summaries(OUTPUT_DIR), inputs)
+
+
+@traced()
+def aggregate(activities=None, incremental=True):
+    """
+    Write the timing and summary CSVs of the logs in the output directory.
 
-    process_files_in_directory(
+    :param incremental: only parse the logs added or changed since the last
+        aggregation
+    :return: (command TimingTable, graphics TimingTable)
+    """
+    resources = read_resource_summaries(OUTPUT_DIR)
+    command_table = process_files_in_directory(
         os.path.join(OUTPUT_DIR, "performance_logs"),
         os.path.join(OUTPUT_DIR,
-                     get_csv_name_by_os("output_command_performance")))
-    process_graphics_output_in_directory(
+                     get_csv_name_by_os("output_command_performance")),
+        incremental=incremental,
+        resources=resources)
+    graphics_table = process_graphics_output_in_directory(
         OUTPUT_DIR,
         os.path.join(OUTPUT_DIR,
-                     get_csv_name_by_os("output_graphics_performance")))
+                     get_csv_name_by_os("output_graphics_performance")),
+        activities,
+        incremental=incremental,
+        resources=resources)
+    write_summaries(command_table, graphics_table)
+    return command_table, graphics_table
+
+
+@traced()
+def write_summaries(command_table, graphics_table):
+    """
+    Write the min/median/p95/stddev over the repeats of every command timing
+    and graphics activity.
+    """
+    write_summary_csv(
+        command_table.getSamples(),
+        os.path.join(OUTPUT_DIR,
+                     get_csv_name_by_os("summary_command_performance")),
+        "Function")
+    write_summary_csv(
+        graphics_table.getSamples(),
+        os.path.join(OUTPUT_DIR,
+                     get_csv_name_by_os("summary_graphics_performance")),
+        "Activity")
+
+
+@traced()
+def compare(baseline=None, candidate=None, threshold=0.05, mad_factor=3.0):
+    """
+    Print the timing changes between two sets of runs and return whether
+    any timing regressed. See `perf_store.compare_runs`.
+    """
+    store = ResultsStore(get_results_db_path())
+    try:
+        default_baseline, default_candidate = get_default_comparison_runs(
+            store, sys.platform.lower())
+        baseline = baseline or default_baseline
+        candidate = candidate or default_candidate
+        if not candidate:
+            logging.error("No candidate runs to compare: no results are "
+                          f"stored in {get_results_db_path()} for "
+                          f"{sys.platform.lower()}, pass --candidate")
+            exit(1)
+        if not baseline:
+            logging.error("No baseline runs to compare: no runs of an "
+                          "earlier commit are stored, pass --baseline")
+            exit(1)
+        logging.info(f"Baseline runs: {baseline}")
+        logging.info(f"Candidate runs: {candidate}")
+        comparisons = compare_runs(store, baseline, candidate, threshold,
+                                   mad_factor)
+    finally:
+        store.close()
+
+    print(f"{'':2}{'Change':>8}  {'Baseline':>10}  {'Candidate':>10}  "
+          "Kind / File / Timing")
+    for comparison in comparisons:
+        flag = "!!" if comparison.regression else ""
+        print(f"{flag:2}{comparison.relative_change:>+8.1%}  "
+              f"{comparison.baseline_median:>10.3f}  "
+              f"{comparison.candidate_median:>10.3f}  "
+              f"{comparison.kind} / {comparison.input_file} / "
+              f"{comparison.name}")
+    regressions = [c for c in comparisons if c.regression]
+    logging.info(f"{len(regressions)} of {len(comparisons)} timings regressed")
+    return bool(regressions)
+
+
+def parse_args():
+    parser = ArgumentParser(
+        prog="performance_tests.py",
+        description="Run the Maestro performance tests and compare their "
+        "results across runs")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser(
+        "run", help="Run the performance tests and store the results "
+        "(default)")
+    run_parser.add_argument("--instances",
+                            type=int,
+                            default=1,
+                            help="Number of isolated Maestro instances to "
+                            "split the input files across (default: 1)")
+    run_parser.add_argument("--per-file",
+                            action="store_true",
+                            help="Start a fresh Maestro for every input file")
+    run_parser.add_argument("--repeat",
+                            type=int,
+                            default=1,
+                            help="Number of timed runs per input file "
+                            "(default: 1)")
+    run_parser.add_argument("--warmup",
+                            type=int,
+                            default=0,
+                            help="Number of untimed runs per input file "
+                            "before the timed ones (default: 0)")
+    run_parser.add_argument("--sample-interval",
+                            type=float,
+                            default=DEFAULT_INTERVAL,
+                            help="Seconds between resource samples of the "
+                            "Maestro processes, 0 to disable (default: "
+                            f"{DEFAULT_INTERVAL})")
+    run_parser.add_argument("--live",
+                            action="store_true",
+                            help="Follow the timing logs while Maestro runs "
+                            "and log the progress")
+    run_parser.add_argument("--file-timeout",
+                            type=float,
+                            metavar="SECONDS",
+                            help="Kill a Maestro run when none of its timing "
+                            "logs progressed for this long (implies --live)")
+    run_parser.add_argument("--recursive",
+                            action="store_true",
+                            help="Also run the input files in the "
+                            "subdirectories of the input directory")
+    run_parser.add_argument("--size-class",
+                            dest="size_classes",
+                            action="append",
+                            choices=[name for name, _ in SIZE_CLASSES],
+                            help="Only run inputs of this uncompressed size "
+                            "class (small < 1 MB, medium < 50 MB, large); may "
+                            "be repeated")
+    run_parser.add_argument("--skip-unchanged",
+                            action="store_true",
+                            help="Skip inputs whose results for the tested "
+                            "commit are already stored")
+    run_parser.add_argument("--stage",
+                            dest="stage_dir",
+                            metavar="DIR",
+                            help="Decompress the compressed inputs once into "
+                            "a cache in DIR, e.g. on a tmpfs, and time them "
+                            "both compressed and uncompressed")
+    run_parser.add_argument("--stage-max-mb",
+                            type=int,
+                            default=DEFAULT_MAX_MB,
+                            help="Size limit of the staging cache, least "
+                            "recently used inputs are evicted past it "
+                            f"(default: {DEFAULT_MAX_MB})")
+    aggregate_parser = subparsers.add_parser(
+        "aggregate",
+        help="Rewrite the CSVs from the timing logs in the output directory "
+        "without running Maestro, only parsing logs added or changed since "
+        "the last aggregation")
+    aggregate_parser.add_argument("--full",
+                                  action="store_true",
+                                  help="Parse all logs again")
+    for subparser in (run_parser, aggregate_parser):
+        subparser.add_argument("--graphics-schema",
+                               metavar="FILE",
+                               help="File listing the graphics activities "
+                               "to report, one per line (default: every "
+                               "activity found in the logs)")
+    compare_parser = subparsers.add_parser(
+        "compare",
+        help="Flag significant regressions between stored runs; by default "
+        "the runs of the latest tested commit against those of the previous "
+        "one")
+    compare_parser.add_argument("--baseline",
+                                nargs="+",
+                                metavar="RUN_ID",
+                                help="Baseline run ids")
+    compare_parser.add_argument("--candidate",
+                                nargs="+",
+                                metavar="RUN_ID",
+                                help="Candidate run ids")
+    compare_parser.add_argument("--threshold",
+                                type=float,
+                                default=0.05,
+                                help="Minimum relative slowdown to flag "
+                                "(default: 0.05)")
+    compare_parser.add_argument("--mad-factor",
+                                type=float,
+                                default=3.0,
+                                help="Minimum slowdown in scaled median "
+                                "absolute deviations to flag (default: 3)")
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--trace",
+                               metavar="FILE",
+                               help="Time the phases of the command, write "
+                               "them as a Chrome trace-event JSON to FILE and "
+                               "print a summary")
+
+    args = sys.argv[1:]
+    if not args or args[0] not in subparsers.choices and args[0] not in (
+            "-h", "--help"):
+        args = ["run"] + args
+    return parser.parse_args(args)
 
 
 def verify_setup():
@@ -250,6 +743,40 @@ def verify_setup():
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.trace:
+        telemetry.enable()
+        atexit.register(telemetry.write_report, args.trace)
+    if args.command == "compare":
+        if not OUTPUT_DIR and not os.getenv(
+                "SCHRODINGER_PERFORMANCE_TEST_RESULTS_DB"):
+            logging.error("Environment variable "
+                          "SCHRODINGER_PERFORMANCE_TEST_OUTPUT is not set")
+            exit(1)
+        exit(1 if compare(args.baseline, args.candidate, args.threshold,
+                          args.mad_factor) else 0)
+    if args.command == "aggregate":
+        if not OUTPUT_DIR:
+            logging.error("Environment variable "
+                          "SCHRODINGER_PERFORMANCE_TEST_OUTPUT is not set")
+            exit(1)
+        aggregate(
+            read_activity_schema(args.graphics_schema)
+            if args.graphics_schema else None,
+            incremental=not args.full)
+        exit(0)
     logging.info("Starting performance tests")
     verify_setup()
-    main()
+    main(instances=args.instances,
+         per_file=args.per_file,
+         repeat=args.repeat,
+         warmup=args.warmup,
+         sample_interval=args.sample_interval,
+         graphics_schema=args.graphics_schema,
+         live=args.live,
+         file_timeout=args.file_timeout,
+         recursive=args.recursive,
+         size_classes=args.size_classes,
+         skip_unchanged=args.skip_unchanged,
+         stage_dir=args.stage_dir,
+         stage_max_mb=args.stage_max_mb)
@@ -0,0 +1,22 @@
+"""
+Split work items into shards of about equal cost, for the Maestro
+benchmark instances and the test runs.
+"""
+
+
+def split_into_shards(items, count, weights=None):
+    """
+    Split `items` into `count` shards, round-robin or, given the expected
+    cost of every item in `weights`, longest first onto the shard with the
+    least total cost.
+    """
+    count = max(1, min(count, len(items)))
+    if weights is None:
+        return [items[i::count] for i in range(count)]
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    for item in sorted(items, key=lambda item: weights[item], reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(item)
+        loads[i] += weights[item]
+    return shards
@@ -0,0 +1,73 @@
+"""
+Measure the cold start time of main.py and fail if it exceeds a budget.
+
+Runs the CLI with the plain interpreter (not $SCHRODINGER/run) several times
+and compares the median wall time of each command line, minus the median
+start time of the bare interpreter, against the budget. The default budget
+leaves headroom over the 40-45 ms argparse and logging take on a typical
+machine, while importing the subcommand modules eagerly (about 45 ms more)
+exceeds it.
+
+    python startup_benchmark.py --runs 20 --budget-ms 60
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+COMMAND_LINES = ([], ["--help"], ["--verify-env"])
+# Milliseconds main.py may take on top of the bare interpreter
+DEFAULT_BUDGET_MS = 60.0
+
+
+def time_command(cmd, runs):
+    """
+    Return the wall times in milliseconds of `runs` runs of `cmd`.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd,
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms",
+                        type=float,
+                        default=DEFAULT_BUDGET_MS,
+                        help="maximum median start time above the bare "
+                        "interpreter")
+    args = parser.parse_args()
+
+    # The interpreter start is subtracted, so a slow machine is not taken
+    # for a slow CLI.
+    baseline = statistics.median(
+        time_command([sys.executable, "-c", "pass"], args.runs))
+    print(f"{'python -c pass':<30} median {baseline:7.1f} ms")
+
+    over_budget = []
+    for command_line in COMMAND_LINES:
+        median = statistics.median(
+            time_command([sys.executable, MAIN_PY] + command_line, args.runs))
+        name = "main.py " + " ".join(command_line)
+        print(f"{name:<30} median {median:7.1f} ms "
+              f"(+{median - baseline:.1f} ms)")
+        if median - baseline > args.budget_ms:
+            over_budget.append(name)
+
+    if over_budget:
+        print(f"Over the {args.budget_ms} ms budget above the interpreter: "
+              f"{over_budget}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
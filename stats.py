@@ -0,0 +1,31 @@
+"""
+Summary statistics of repeated measurements.
+"""
+import collections
+import math
+import statistics
+
+Summary = collections.namedtuple("Summary",
+                                 ["count", "min", "median", "p95", "stddev"])
+
+
+def percentile(sorted_values, fraction):
+    """
+    Linearly interpolated percentile of already sorted values.
+    """
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] -
+                                   sorted_values[lower]) * (position - lower)
+
+
+def summarize(values):
+    if len(values) == 1:
+        return Summary(1, values[0], values[0], values[0], 0.0)
+    values = sorted(values)
+    return Summary(count=len(values),
+                   min=values[0],
+                   median=statistics.median(values),
+                   p95=percentile(values, 0.95),
+                   stddev=statistics.stdev(values) if len(values) > 1 else 0.0)
@@ -0,0 +1,165 @@
+"""
+Lightweight spans timing the phases of a command.
+
+    with telemetry.span("waf build", step="maestro"):
+        ...
+
+    @telemetry.traced()
+    def aggregate(...):
+        ...
+
+Nothing is recorded until `enable` is called: `span` then returns a shared
+no-op context manager and `traced` functions only pay for a global check.
+Recorded spans can be written as a Chrome trace-event JSON file, viewable in
+chrome://tracing or https://ui.perfetto.dev, with one lane per thread, and
+summarized per span name.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+_DISABLED_SPAN = contextlib.nullcontext()
+_recorder = None
+
+
+class _Recorder:
+
+    def __init__(self):
+        self.start_ns = time.perf_counter_ns()
+        # Appending to a list is atomic, so spans of worker threads need no
+        # lock.
+        self.events = []
+        self.thread_names = {}
+
+
+class _Span:
+    __slots__ = ("_name", "_args", "_start_ns")
+
+    def __init__(self, name, args):
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end_ns = time.perf_counter_ns()
+        recorder = _recorder
+        if recorder is None:
+            return
+        thread = threading.current_thread()
+        recorder.thread_names.setdefault(thread.ident, thread.name)
+        recorder.events.append(
+            (self._name, self._start_ns, end_ns, thread.ident, self._args))
+
+
+def enable():
+    """
+    Start recording spans, dropping any recorded before.
+    """
+    global _recorder
+    _recorder = _Recorder()
+
+
+def span(name, **args):
+    """
+    :param args: JSON serializable details shown with the span in the trace
+    :return: context manager timing its block as a span named `name`
+    """
+    if _recorder is None:
+        return _DISABLED_SPAN
+    return _Span(name, args)
+
+
+def traced(name=None):
+    """
+    Decorator timing every call of the function as a span, named after the
+    function by default.
+    """
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with _Span(span_name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def write_trace(path):
+    """
+    Write the recorded spans as Chrome trace-event JSON.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return
+    pid = os.getpid()
+    events = [{
+        "name": "thread_name",
+        "ph": "M",
+        "pid": pid,
+        "tid": tid,
+        "args": {
+            "name": thread_name
+        }
+    } for tid, thread_name in recorder.thread_names.items()]
+    events += [{
+        "name": name,
+        "ph": "X",
+        "ts": (start_ns - recorder.start_ns) / 1000,
+        "dur": (end_ns - start_ns) / 1000,
+        "pid": pid,
+        "tid": tid,
+        "args": args
+    } for name, start_ns, end_ns, tid, args in recorder.events]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def format_summary():
+    """
+    :return: printable table of the count, total, mean and maximum time of
+        the spans of every name, longest total first; nested spans are
+        counted in their parents' time as well, and spans running
+        concurrently can add up to more than the wall time
+    """
+    recorder = _recorder
+    if recorder is None:
+        return ""
+    wall_ms = (time.perf_counter_ns() - recorder.start_ns) / 1e6
+    durations = {}
+    for name, start_ns, end_ns, _, _ in recorder.events:
+        durations.setdefault(name, []).append((end_ns - start_ns) / 1e6)
+    lines = [
+        f"{'Span':<32} {'Count':>6} {'Total ms':>10} {'Mean ms':>9} "
+        f"{'Max ms':>9} {'% wall':>7}"
+    ]
+    for name, values in sorted(durations.items(),
+                               key=lambda item: sum(item[1]),
+                               reverse=True):
+        total = sum(values)
+        lines.append(f"{name[:32]:<32} {len(values):>6} {total:>10.1f} "
+                     f"{total / len(values):>9.1f} {max(values):>9.1f} "
+                     f"{total / wall_ms:>7.1%}")
+    lines.append(f"{'wall time':<32} {'':>6} {wall_ms:>10.1f}")
+    return "\n".join(lines)
+
+
+def write_report(trace_file):
+    """
+    Write the trace to `trace_file` and print the summary to stderr.
+    """
+    write_trace(trace_file)
+    print(format_summary(), file=sys.stderr)
+    print(f"Trace written to {trace_file}", file=sys.stderr)
@@ -0,0 +1,215 @@
+import collections
+import concurrent.futures
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from cmd_runner import kill_process_group
+from environment import get_environment
+from telemetry import span
+
+
+class Tester:
+
+    def run_tests(self,
+                  test_path,
+                  count,
+                  jobs=None,
+                  keep_going=False,
+                  affected_by=None):
+        """
+        Run the tests at `test_path` `count` times on `jobs` workers.
+
+        :param affected_by: if given, only run the tests under `test_path`
+            affected by the files modified relative to this diff generator,
+            as shards of about equal duration, see `impacted_tests`
+        """
+        count = int(count)
+        if count < 1:
+            raise ValueError("Count should be greater than 0")
+        jobs = int(jobs or os.cpu_count() or 1)
+        if jobs < 1:
+            raise ValueError("Jobs should be greater than 0")
+        if not os.path.exists(test_path):
+            raise ValueError(f"Test path does not exist: {test_path}")
+
+        env = get_environment()
+        output_dir = os.path.join(env.schrodinger, "test_output")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+
+        logging.info(
+            f"Running tests in parallel {test_path} , {count} times with "
+            f"{jobs} jobs")
+        logging.info(f"Writing per-run results to {output_dir}")
+
+        durations = None
+        if affected_by is None:
+            run = _TestRun([[env.schrodinger_run_cmd, test_path]], output_dir)
+        else:
+            # Imported here so plain test runs do not pay for git and the
+            # import graph.
+            from formatter import get_modified_files
+            from impacted_tests import (TestDurations, find_test_files,
+                                        select_tests)
+            from sharding import split_into_shards
+            with span("select tests"):
+                test_files = select_tests(
+                    find_test_files(test_path),
+                    get_modified_files(env.repos, affected_by, jobs))
+            if not test_files:
+                logging.info("No tests affected by the modified files")
+                return
+            durations = TestDurations()
+            weights = durations.getWeights(test_files)
+            shards = split_into_shards(test_files, jobs, weights)
+            for i, shard in enumerate(shards):
+                logging.info(f"Shard {i}: {len(shard)} tests, expected "
+                             f"{sum(weights[file] for file in shard):.1f} s")
+            # Every shard reports the time of its tests for the next split.
+            run = _TestRun([[
+                env.pytest_cmd, "-o", "junit_family=xunit1",
+                "--junitxml={report}"
+            ] + shard for shard in shards], output_dir)
+
+        passed, failed = 0, []
+        run_count = count * len(run.cmds)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(run.start, i): i for i in range(run_count)}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    i = futures[future]
+                    if future.cancelled() or i in run.cancelled:
+                        continue
+                    if future.result() == 0:
+                        passed += 1
+                        continue
+                    failed.append(i)
+                    logging.error(
+                        f"Test failed in {i}th run, see {run.getLogFile(i)}")
+                    if not keep_going and not run.stopped:
+                        logging.error("Stopping further test execution")
+                        run.stop()
+                        for pending in futures:
+                            pending.cancel()
+            except BaseException:
+                # Ctrl-C does not reach the runs in their own sessions.
+                run.stop()
+                raise
+
+        if durations is not None:
+            for test_file, seconds in _read_durations(run, shards).items():
+                durations.record(test_file, seconds)
+            durations.save()
+
+        cancelled = run_count - passed - len(failed)
+        logging.info(f"Passed: {passed}, failed: {len(failed)}, "
+                     f"cancelled: {cancelled} (out of {run_count} runs)")
+        if failed:
+            raise RuntimeError(f"Test failed in runs {sorted(failed)}")
+        logging.info("Test ran successfully every time")
+
+
+def _read_durations(run, shards):
+    """
+    Read the time of every test file from the JUnit reports of the shard
+    runs.
+
+    :return: mean time in seconds of every test file over its runs
+    """
+    totals = collections.Counter()
+    runs = collections.Counter()
+    for i, report in run.getReports():
+        try:
+            root = ElementTree.parse(report).getroot()
+        except (OSError, ElementTree.ParseError):
+            continue
+        shard = shards[i % len(shards)]
+        seconds = collections.Counter()
+        for case in root.iter("testcase"):
+            # The file is relative to the pytest root directory.
+            case_file = os.path.normpath(case.get("file", ""))
+            for test_file in shard:
+                if test_file == case_file or test_file.endswith(os.sep +
+                                                                case_file):
+                    seconds[test_file] += float(case.get("time", 0))
+                    break
+        for test_file, value in seconds.items():
+            totals[test_file] += value
+            runs[test_file] += 1
+    return {
+        test_file: totals[test_file] / runs[test_file]
+        for test_file in totals
+    }
+
+
+class _TestRun:
+    """
+    Runs repeats of a set of test commands, each streaming its output to its
+    own log file. Run `i` runs command `i % len(cmds)`; a "{report}"
+    argument is replaced by the path of the run's report file. In-flight
+    runs can be cancelled through `stop`.
+    """
+
+    def __init__(self, cmds, output_dir):
+        self.cmds = cmds
+        self._output_dir = output_dir
+        self._lock = threading.Lock()
+        self._procs = {}
+        self.stopped = False
+        self.cancelled = set()
+
+    def getLogFile(self, i):
+        return os.path.join(self._output_dir, f"run_{i}.log")
+
+    def getReportFile(self, i):
+        return os.path.join(self._output_dir, f"run_{i}.xml")
+
+    def getReports(self):
+        """
+        :return: (run index, report file) of the runs that wrote a report
+        """
+        return sorted((int(name[len("run_"):-len(".xml")]),
+                       os.path.join(self._output_dir, name))
+                      for name in os.listdir(self._output_dir)
+                      if name.startswith("run_") and name.endswith(".xml"))
+
+    def start(self, i):
+        with self._lock:
+            if self.stopped:
+                self.cancelled.add(i)
+                return None
+            cmd = [
+                arg.replace("{report}", self.getReportFile(i))
+                for arg in self.cmds[i % len(self.cmds)]
+            ]
+            log = open(self.getLogFile(i), "w")
+            log.write(f"Running {' '.join(cmd)} (run {i})\n")
+            log.flush()
+            # The child writes straight to the log file, so nothing is
+            # buffered in this process however verbose the test is. It runs
+            # in its own session so that `stop` also reaches the processes
+            # the $SCHRODINGER wrapper scripts start.
+            proc = subprocess.Popen(cmd,
+                                    stdout=log,
+                                    stderr=subprocess.STDOUT,
+                                    start_new_session=True)
+            self._procs[i] = proc
+        try:
+            with span("test run", run=i):
+                return proc.wait()
+        finally:
+            log.close()
+            with self._lock:
+                self._procs.pop(i, None)
+
+    def stop(self):
+        with self._lock:
+            self.stopped = True
+            for i, proc in self._procs.items():
+                self.cancelled.add(i)
+                kill_process_group(proc.pid, signal.SIGTERM)
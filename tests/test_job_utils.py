@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+import job_utils
+
+
+class FakeTime:
+    """
+    Clock that only advances when sleeping, so job durations are exactly
+    the simulated ones.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(job_utils, "time", fake)
+    return fake
+
+
+def test_tracker_summary(fake_time):
+    # One job at a time, taking 18.6, 14.2, 5.5, 3.0 and 7.2 ms
+    source = job_utils.SyntheticEventSource(5,
+                                            concurrency=1,
+                                            mean_duration=0.01)
+    stream = io.StringIO()
+    tracker = job_utils.JobTracker("test", source, stream=stream)
+    source.run()
+    summary = tracker.close()
+
+    # started, completed, running
+    assert summary[:3] == (5, 5, 0)
+    assert summary.p50_ms == pytest.approx(7.160, abs=1e-3)
+    assert summary.p90_ms == pytest.approx(16.838, abs=1e-3)
+    assert summary.p99_ms == pytest.approx(18.429, abs=1e-3)
+    assert summary.max_ms == pytest.approx(18.606, abs=1e-3)
+    assert summary.jobs_per_second == pytest.approx(5 / fake_time.now)
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "Job count before start: 5"
+    assert lines[-2] == "Jobs of test: 5 started, 5 completed, 0 running"
+
+
+def test_tracker_ring_buffer_keeps_latest_jobs(fake_time):
+    source = job_utils.SyntheticEventSource(10,
+                                            concurrency=1,
+                                            mean_duration=0.01)
+    tracker = job_utils.JobTracker("test",
+                                   source,
+                                   capacity=3,
+                                   stream=io.StringIO(),
+                                   verbose=False)
+    source.run()
+    summary = tracker.close()
+
+    assert summary[:3] == (10, 10, 0)
+    # Only the last 3 jobs, of 3.6, 6.5 and 8.8 ms, are kept
+    assert summary.p50_ms == pytest.approx(6.474, abs=1e-3)
+    assert summary.max_ms == pytest.approx(8.756, abs=1e-3)
+
+
+def test_event_source_requires_connect_and_job_count():
+    with pytest.raises(TypeError):
+        job_utils.JobEventSource()
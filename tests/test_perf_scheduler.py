@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import performance_tests
+from cli_benchmark import FakeToolchain
+from perf_scheduler import run_sharded
+from perf_store import ResultsStore
+
+INPUT_NAMES = ["a.mae", "b.mae", "c.mae", os.path.join("sub", "a.mae")]
+
+
+@pytest.fixture
+def toolchain(tmp_path, monkeypatch):
+    toolchain = FakeToolchain(str(tmp_path))
+    toolchain.install()
+    for name in INPUT_NAMES:
+        path = os.path.join(toolchain.input_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("structure\n")
+    monkeypatch.setattr(performance_tests, "INPUT_DIR", toolchain.input_dir)
+    monkeypatch.setattr(performance_tests, "OUTPUT_DIR", toolchain.output_dir)
+    monkeypatch.setenv("SCHRODINGER_PERFORMANCE_TEST_MAESTRO",
+                       os.path.join(toolchain.schrodinger, "maestro"))
+    monkeypatch.setenv("SCHRODINGER_PERFORMANCE_TEST_COMMIT", "abc123")
+    return toolchain
+
+
+def _get_input_files(toolchain):
+    return [os.path.join(toolchain.input_dir, name) for name in INPUT_NAMES]
+
+
+def test_run_sharded_merges_logs(toolchain):
+    failures = run_sharded(_get_input_files(toolchain),
+                           toolchain.output_dir,
+                           performance_tests.prepare_cmd_string,
+                           instances=2,
+                           sample_interval=0)
+
+    assert failures == 0
+    log_names = sorted(
+        performance_tests.get_log_name(name) for name in INPUT_NAMES)
+    for sub_dir in ("", "performance_logs"):
+        assert sorted(
+            name
+            for name in os.listdir(os.path.join(toolchain.output_dir, sub_dir))
+            if name.endswith(".log")) == log_names
+
+
+def test_run_sharded_counts_failed_instances(toolchain):
+    toolchain.install({"maestro": "#!/bin/sh\nexit 1\n"})
+    failures = run_sharded(_get_input_files(toolchain),
+                           toolchain.output_dir,
+                           performance_tests.prepare_cmd_string,
+                           instances=2,
+                           sample_interval=0)
+    assert failures == 2
+
+
+def test_main_stores_sharded_results(toolchain):
+    performance_tests.main(instances=2, recursive=True, sample_interval=0)
+
+    store = ResultsStore(performance_tests.get_results_db_path())
+    try:
+        runs = store.getRuns()
+        samples = store.getSamples([run.run_id for run in runs])
+        input_hashes = store.getInputHashes("abc123", runs[0].os)
+    finally:
+        store.close()
+    assert [run.git_commit for run in runs] == ["abc123"]
+    assert sorted(name for name, _ in input_hashes) == sorted(INPUT_NAMES)
+    for name in INPUT_NAMES:
+        assert samples[("graphics", performance_tests.get_log_name(name),
+                        "Main Drawing")] == [0.01]
+    # The stub names command logs after the input file name only, so both
+    # a.mae inputs add up in one row
+    assert samples[("command", "a.mae", "import")] == [20.0]
+    assert samples[("command", "b.mae", "import")] == [10.0]
@@ -0,0 +1,72 @@
+import pytest
+
+import performance_tests
+from perf_logs import TimingTable
+from perf_profiler import ResourceSummary
+from perf_store import ResultsStore
+
+
+@pytest.fixture
+def results_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(performance_tests, "OUTPUT_DIR", str(tmp_path))
+    path = str(tmp_path / "results.sqlite")
+    monkeypatch.setenv("SCHRODINGER_PERFORMANCE_TEST_RESULTS_DB", path)
+    monkeypatch.setenv("SCHRODINGER_PERFORMANCE_TEST_COMMIT", "abc123")
+    return path
+
+
+def test_store_results_round_trip(results_db):
+    command_table = TimingTable()
+    command_table.add("a.mae", {"import": 10.0})
+    graphics_table = TimingTable()
+    graphics_table.add("a.mae.log", {"Main Drawing": 0.5}, repeat=0)
+    graphics_table.add("a.mae.log", {"Main Drawing": 0.7}, repeat=1)
+    resources = {
+        "a.mae.rep0.log": ResourceSummary(peak_rss_kb=2048, cpu_seconds=1.5),
+        "a.mae.rep1.log": ResourceSummary(peak_rss_kb=3072, cpu_seconds=2.5),
+    }
+    performance_tests.store_results(command_table, graphics_table, resources)
+
+    store = ResultsStore(results_db)
+    try:
+        run_ids = [run.run_id for run in store.getRuns()]
+        samples = store.getSamples(run_ids)
+    finally:
+        store.close()
+    assert samples[("command", "a.mae", "import")] == [10.0]
+    assert sorted(samples[("graphics", "a.mae.log",
+                           "Main Drawing")]) == [0.5, 0.7]
+    assert sorted(samples[("resources", "a.mae.log",
+                           "peak_rss_mb")]) == [2.0, 3.0]
+    assert sorted(samples[("resources", "a.mae.log",
+                           "cpu_seconds")]) == [1.5, 2.5]
+
+
+def test_nested_inputs_log_to_separate_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(performance_tests, "INPUT_DIR", str(tmp_path))
+    input_files = [str(tmp_path / "a.mae"), str(tmp_path / "sub" / "a.mae")]
+    cmd_string = performance_tests.prepare_cmd_string(input_files,
+                                                      output_dir="out")
+    log_files = [
+        line.split("=", 1)[1] for line in cmd_string.splitlines()
+        if line.startswith("timingsetup")
+    ]
+    assert log_files == ["out/a.mae.log", "out/sub__a.mae.log"]
+
+
+def test_command_csv_has_resource_columns(tmp_path):
+    log_dir = tmp_path / "performance_logs"
+    log_dir.mkdir()
+    (log_dir / "sub__a.mae.log").write_text('"a.mae"\nimport = 10 ms\n')
+    resources = {
+        "sub__a.mae.log": ResourceSummary(peak_rss_kb=2048, cpu_seconds=1.5)
+    }
+    output_csv = tmp_path / "command.csv"
+    performance_tests.process_files_in_directory(str(log_dir),
+                                                 str(output_csv),
+                                                 incremental=False,
+                                                 resources=resources)
+    assert output_csv.read_text().splitlines() == [
+        "Filename,import,Peak RSS (MB),CPU (s)",
+        "a.mae,10,2,1.5",
+    ]